@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+from enum import Enum
+import io
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+import xml.etree.ElementTree as ET
+import pymarc
+
+# Internal import
+import api.XML_Backend as xmlb
+from api.Koha_SRU import Koha_SRU, SRU_Indexes, SRU_Operations, SRU_Record_Schemas, SRU_Version, Status
+
+# Resolves 4XX targets from a local Koha export instead of the SRU
+# Only the indexes used by this script are supported :
+#   - rec.id → 001
+#   - dc.issn → 011$a
+#   - dc.isbn → 010$a & 013$a
+
+# See README.md for more informations
+
+# --------------- Enums ---------------
+
+MARC_NS = "http://www.loc.gov/MARC21/slim"
+XML_NS = {
+    "marc": MARC_NS
+    }
+
+class Export_Formats(Enum):
+    ISO2709 = "iso2709"
+    MARCXML = "marcxml"
+
+class Errors(Enum):
+    UNSUPPORTED_QUERY = "Query not supported by the local export"
+    NOT_LOADED = "Local export was not loaded"
+
+# Regex used to cut a MARCXML file in records without parsing it
+MARCXML_RECORD_START = re.compile(r"<(?:[\w.-]+:)?record[\s>]")
+MARCXML_RECORD_END = re.compile(r"</(?:[\w.-]+:)?record\s*>")
+ISO2709_RECORD_END = b"\x1d"
+
+# --------------- Functions ---------------
+
+def normalize_key(index:str, value:str) -> str:
+    """Returns the value normalised for an index of the local export"""
+    if value is None:
+        return ""
+    if index in [SRU_Indexes.ISSN.value, SRU_Indexes.ISBN.value]:
+        return re.sub("[^0-9X]", "", value.upper())
+    return value.strip()
+
+def guess_format(file_path:str) -> Export_Formats:
+    """Returns the format of the export based on its first non blank character"""
+    with open(file_path, mode="rb") as f:
+        start = f.read(1024).lstrip()
+    if start.startswith(b"<") or start.startswith(b"\xef\xbb\xbf<"):
+        return Export_Formats.MARCXML
+    return Export_Formats.ISO2709
+
+def iter_iso2709_chunks(file_path:str, records_per_chunk:int, block_size:int=4*1024*1024):
+    """Yields the raw ISO2709 file as bytes containing up to records_per_chunk records"""
+    with open(file_path, mode="rb") as f:
+        buffer = b""
+        records = []
+        for block in iter(lambda: f.read(block_size), b""):
+            buffer += block
+            parts = buffer.split(ISO2709_RECORD_END)
+            buffer = parts.pop()
+            for part in parts:
+                records.append(part + ISO2709_RECORD_END)
+                if len(records) >= records_per_chunk:
+                    yield b"".join(records)
+                    records = []
+        if buffer.strip():
+            records.append(buffer)
+        if records:
+            yield b"".join(records)
+
+def iter_marcxml_chunks(file_path:str, records_per_chunk:int, block_size:int=4*1024*1024):
+    """Yields the MARCXML file as strings containing up to records_per_chunk record nodes"""
+    with open(file_path, mode="r", encoding="utf-8") as f:
+        buffer = ""
+        records = []
+        for block in iter(lambda: f.read(block_size), ""):
+            buffer += block
+            while True:
+                start = MARCXML_RECORD_START.search(buffer)
+                if not start:
+                    # Keeps a small tail in case a start tag is cut
+                    buffer = buffer[-64:]
+                    break
+                end = MARCXML_RECORD_END.search(buffer, start.start())
+                if not end:
+                    buffer = buffer[start.start():]
+                    break
+                records.append(buffer[start.start():end.end()])
+                buffer = buffer[end.end():]
+                if len(records) >= records_per_chunk:
+                    yield "".join(records)
+                    records = []
+        if records:
+            yield "".join(records)
+
+def extract_keys(record:ET.Element) -> tuple:
+    """Returns the 001, the ISSNs and the ISBNs of a MARCXML record"""
+    bibnb = None
+    bibnb_node = record.find("marc:controlfield[@tag='001']", XML_NS)
+    if bibnb_node is not None and bibnb_node.text:
+        bibnb = bibnb_node.text.strip()
+    issns = [node.text for node in record.findall("marc:datafield[@tag='011']/marc:subfield[@code='a']", XML_NS) if node.text]
+    isbns = [node.text for node in record.findall("marc:datafield[@tag='010']/marc:subfield[@code='a']", XML_NS) if node.text]
+    isbns += [node.text for node in record.findall("marc:datafield[@tag='013']/marc:subfield[@code='a']", XML_NS) if node.text]
+    return bibnb, issns, isbns
+
+def parse_iso2709_chunk(chunk:bytes) -> List[tuple]:
+    """Parses a chunk of ISO2709 records.
+    Returns a list of tuples (001, ISSNs, ISBNs, MARCXML record as bytes)"""
+    output = []
+    reader = pymarc.MARCReader(io.BytesIO(chunk), to_unicode=True, force_utf8=True)
+    for record in reader:
+        if record is None:
+            continue
+        xml_record = pymarc.record_to_xml_node(record, namespace=True)
+        # Reparse it so namespaces are resolved the same way than the MARCXML files
+        xml_as_bytes = ET.tostring(xml_record, encoding="utf-8")
+        bibnb, issns, isbns = extract_keys(ET.fromstring(xml_as_bytes))
+        output.append((bibnb, issns, isbns, xml_as_bytes))
+    return output
+
+def parse_marcxml_chunk(chunk:str) -> List[tuple]:
+    """Parses a chunk of MARCXML record nodes.
+    Returns a list of tuples (001, ISSNs, ISBNs, MARCXML record as bytes)"""
+    output = []
+    # Declares the MARC namespace for the default namespace & all prefixes used in the chunk
+    prefixes = set(re.findall(r"<([\w.-]+):record[\s>]", chunk))
+    declarations = f'xmlns="{MARC_NS}"' + "".join([f' xmlns:{prefix}="{MARC_NS}"' for prefix in prefixes])
+    root = ET.fromstring(f"<collection {declarations}>{chunk}</collection>")
+    for record in root.findall("marc:record", XML_NS):
+        bibnb, issns, isbns = extract_keys(record)
+        output.append((bibnb, issns, isbns, ET.tostring(record, encoding="utf-8")))
+    return output
+
+# --------------- Class Objects ---------------
+
+class Koha_Local_Export(Koha_SRU):
+    """Koha_Local_Export
+    =======
+    A drop-in replacement for Koha_SRU using a local Koha export (MARCXML or ISO2709)
+    On init take as arguments :
+        - file_path {str} : path to the export
+        - [optional] processes {int} : number of processes used to parse the export, defaults to os.cpu_count()
+        - [optional] records_per_chunk {int} : number of records sent to each process at once
+        - [optional] service {str} : Name of the service for the logs
+    The export is only parsed when load() is called"""
+    def __init__(self, file_path:str, processes:int=None, records_per_chunk:int=1000, service="Koha_Local_Export"):
+        self.file_path = file_path
+        self.endpoint = file_path
+        self.version = SRU_Version.V1_1.value
+        self.processes = processes
+        if not self.processes or self.processes < 1:
+            self.processes = os.cpu_count() or 1
+        self.records_per_chunk = records_per_chunk
+        self.loaded = False
+        # Data
+        self.records:List[bytes] = []
+        self.indexes:Dict[str, Dict[str, List[int]]] = {
+            SRU_Indexes.BIBLIONUMBER.value:{},
+            SRU_Indexes.ISSN.value:{},
+            SRU_Indexes.ISBN.value:{}
+        }
+        # logs
+        self.logger = logging.getLogger(service)
+        self.service = service
+
+    def load(self):
+        """Parses the export in parallel and builds the indexes"""
+        export_format = guess_format(self.file_path)
+        if export_format == Export_Formats.MARCXML:
+            chunks = iter_marcxml_chunks(self.file_path, self.records_per_chunk)
+            parse_func = parse_marcxml_chunk
+        else:
+            chunks = iter_iso2709_chunks(self.file_path, self.records_per_chunk)
+            parse_func = parse_iso2709_chunk
+
+        if self.processes == 1:
+            results = map(parse_func, chunks)
+            self.__index_results(results)
+        else:
+            with ProcessPoolExecutor(max_workers=self.processes) as executor:
+                self.__index_results(executor.map(parse_func, chunks))
+        self.loaded = True
+        self.logger.info(f"Load :: Koha_Local_Export Load :: {len(self.records)} records loaded from {self.file_path} ({export_format.value})")
+
+    def __index_results(self, results):
+        """Adds parsed chunks to the records & the indexes"""
+        for chunk_result in results:
+            for bibnb, issns, isbns, xml_as_bytes in chunk_result:
+                position = len(self.records)
+                self.records.append(xml_as_bytes)
+                self.__add_key(SRU_Indexes.BIBLIONUMBER.value, bibnb, position)
+                for issn in issns:
+                    self.__add_key(SRU_Indexes.ISSN.value, issn, position)
+                for isbn in isbns:
+                    self.__add_key(SRU_Indexes.ISBN.value, isbn, position)
+
+    def __add_key(self, index:str, value:str, position:int):
+        """Adds a record position to an index"""
+        key = normalize_key(index, value)
+        if key == "":
+            return
+        positions = self.indexes[index].setdefault(key, [])
+        # Avoids duplicates if the same ID is in the record twice
+        if position not in positions:
+            positions.append(position)
+
+    def set_pool_size(self, size:int):
+        """No connection to keep for a local export"""
+        return
+
+    def explain(self):
+        """Not supported for a local export"""
+        return None
+
+    def search(self, query:str, record_schema=SRU_Record_Schemas.MARCXML, start_record=1, maximum_records=100):
+        """Searches the local export and returns a Local_Result_Search instance
+        Takes the same arguments as Koha_SRU.search(), the query must be a single Part_Of_Query
+        using rec.id, dc.issn or dc.isbn with the = relation"""
+        # Checks some input values validity
+        maximum_records = self.to_int(maximum_records)
+        if not maximum_records:
+            maximum_records = 100
+        elif maximum_records > 1001:
+            maximum_records = 1000
+        elif maximum_records < 1:
+            maximum_records = 10
+        start_record = self.to_int(start_record)
+        if not start_record:
+            start_record = 1
+        elif start_record < 1:
+            start_record = 1
+
+        if not self.loaded:
+            self.logger.error(f"{query} :: Koha_Local_Export Search :: Export was not loaded")
+            return Local_Result_Search(Status.ERROR, Errors.NOT_LOADED, [], 0, query, self.file_path)
+
+        index, _, value = query.partition("=")
+        index = index.strip()
+        if index not in self.indexes or value.strip() == "":
+            self.logger.error(f"{query} :: Koha_Local_Export Search :: Unsupported query")
+            return Local_Result_Search(Status.ERROR, Errors.UNSUPPORTED_QUERY, [], 0, query, self.file_path)
+
+        positions = self.indexes[index].get(normalize_key(index, value), [])
+        self.logger.debug(f"{query} :: Koha_Local_Export Search :: Success")
+        records = [xmlb.fromstring(self.records[position]) for position in positions[start_record-1:start_record-1+maximum_records]]
+        return Local_Result_Search(Status.SUCCESS, None, records, len(positions), query, self.file_path)
+
+# ---------- Local Search Result ----------
+
+class Local_Result_Search(object):
+    """Local_Result_Search
+    =======
+    Mirrors SRU_Result_Search for a search in a local export"""
+
+    def __init__(self, status: Status, error: Errors, records: List[ET.Element], nb_results: int, query: str, url: str):
+        self.operation = SRU_Operations.SEARCH.value
+        self.url = url
+        self.status = status.value
+        self.query = query
+        if error:
+            self.error = error.value
+            return
+        else:
+            self.error = None
+
+        # Calculated infos
+        self.nb_results = nb_results
+        self.records = records
+        self.records_id = self.get_records_id()
+
+    def get_result(self):
+        """Return the matched records"""
+        return self.records
+
+    def get_status(self):
+        """Return the init status as a string."""
+        return self.status
+
+    def get_error_msg(self):
+        """Return the error message."""
+        return str(self.error)
+
+    def get_nb_results(self):
+        """Returns the number of results as an int."""
+        return self.nb_results
+
+    def get_records(self):
+        """Returns all records as a list"""
+        return self.records
+
+    def get_records_id(self):
+        """Returns the 001 of all records as a list of strings, None for records without one"""
+        output = []
+        for record in self.records:
+            # Controlfield 001 search
+            node = xmlb.get_controlfield(record, "001")
+            output.append(node.text if node is not None else None)
+        return output
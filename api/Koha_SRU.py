@@ -7,6 +7,9 @@ import requests
 import xml.etree.ElementTree as ET
 import urllib.parse
 
+# Internal import
+import api.XML_Backend as xmlb
+
 #https://koha-community.org/manual/20.11/fr/html/webservices.html#sru-server
 # https://www.loc.gov/standards/sru/sru-1-1.html
 # https://www.loc.gov/standards/sru/cql/contextSets/cql-context-set-v1-2.html
@@ -213,10 +216,22 @@ class Koha_SRU(object):
                 self.version = SRU_Version.V2_0.value
         else:
             self.version = version
+        # Keeps connections alive between requests
+        self.session = self.new_session()
         # logs
         self.logger = logging.getLogger(service)
         self.service = service
 
+    def new_session(self) -> requests.Session:
+        """Returns the HTTP session used for requests"""
+        return requests.Session()
+
+    def set_pool_size(self, size:int):
+        """Keeps up to size connections alive, for threads sharing this instance"""
+        adapter = requests.adapters.HTTPAdapter(pool_connections=size, pool_maxsize=size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
     def explain(self):
         """GET an explain request from the SRU and returns a SRU_Result_Explain instance"""
 
@@ -224,10 +239,12 @@ class Koha_SRU(object):
         status = None
         error_msg = None
         result = ""
+        http_status = None
 
         # Request
         try:
-            r = requests.get(url)
+            r = self.session.get(url)
+            http_status = r.status_code
             r.raise_for_status()
         except requests.exceptions.HTTPError:
             status = Status.ERROR
@@ -242,7 +259,7 @@ class Koha_SRU(object):
             self.logger.debug(f"Explain :: Koha_SRU Explain :: Success")
             result = r.content.decode('utf-8')
         
-        return SRU_Result_Explain(status, error_msg, result, url)
+        return SRU_Result_Explain(status, error_msg, result, url, http_status)
 
     # Not supported (my instance ?)
     # def scan(self, scan_clause: str, maximum_terms=25, response_position=1):
@@ -307,6 +324,39 @@ class Koha_SRU(object):
             - [optional] start_record {int} : the position of the first result in the query result list (> 0)
             - [optional] maximum_records {int} : the maximum records to be returned (between 1 and 1000)"""
 
+        query, record_schema, start_record, maximum_records, url = self.generate_search_url(query, record_schema, start_record, maximum_records)
+        status = None
+        error_msg = None
+        result = ""
+        http_status = None
+
+        # Request
+        try:
+            r = self.session.get(url)
+            http_status = r.status_code
+            r.raise_for_status()
+        except requests.exceptions.HTTPError:
+            status = Status.ERROR
+            error_msg = Errors.HTTP_ERROR
+            self.logger.error(f"{query} :: Koha_SRU Search Retrieve :: HTTP Status: {r.status_code} || Method: {r.request.method} || URL: {r.url} || Response: {r.text}")
+        except requests.exceptions.RequestException as generic_error:
+            status = Status.ERROR
+            error_msg = Errors.GENERIC
+            self.logger.error(f"{query} :: Koha_SRU Search Retrieve :: Generic exception || URL: {url} || {generic_error}")
+        else:
+            status = Status.SUCCESS
+            self.logger.debug(f"{query} :: Koha_SRU Search Retrieve :: Success")
+            result = r.content.decode('utf-8')
+
+        return SRU_Result_Search(status, error_msg, result,
+                record_schema, self.version, maximum_records,
+                start_record, query, url, http_status)
+
+    def generate_search_url(self, query:str, record_schema=SRU_Record_Schemas.MARCXML, start_record=1, maximum_records=100):
+        """Returns the search retrieve parameters after validation & the URL as a tuple :
+        (quoted query, record schema, start record, maximum records, URL)
+        Takes the same arguments as search()"""
+
         # Query part
         query = urllib.parse.quote(query)
 
@@ -333,31 +383,8 @@ class Koha_SRU(object):
         # Defines the URL
         url = f"{self.endpoint}?version={self.version}&recordSchema={record_schema}"\
             f"&operation={SRU_Operations.SEARCH.value}&query={query}"\
-                f"&startRecord={start_record}&maximumRecords={maximum_records}"                                
-        status = None
-        error_msg = None
-        result = ""
-
-        # Request
-        try:
-            r = requests.get(url)
-            r.raise_for_status()
-        except requests.exceptions.HTTPError:
-            status = Status.ERROR
-            error_msg = Errors.HTTP_ERROR
-            self.logger.error(f"{query} :: Koha_SRU Search Retrieve :: HTTP Status: {r.status_code} || Method: {r.request.method} || URL: {r.url} || Response: {r.text}")
-        except requests.exceptions.RequestException as generic_error:
-            status = Status.ERROR
-            error_msg = Errors.GENERIC
-            self.logger.error(f"{query} :: Koha_SRU Search Retrieve :: Generic exception || URL: {url} || {generic_error}")
-        else:
-            status = Status.SUCCESS
-            self.logger.debug(f"{query} :: Koha_SRU Search Retrieve :: Success")
-            result = r.content.decode('utf-8')
-
-        return SRU_Result_Search(status, error_msg, result,
-                record_schema, self.version, maximum_records,
-                start_record, query, url)
+                f"&startRecord={start_record}&maximumRecords={maximum_records}"
+        return query, record_schema, start_record, maximum_records, url
 
     def generate_query(self, list: list):
         """Returns a query from multiple parts of query as a string.
@@ -391,10 +418,12 @@ class SRU_Result_Explain(object):
     =======
     A set of function to handle an explain request response from Sudoc's SRU"""
 
-    def __init__(self, status: Status, error: Errors, result: str, url: str):
+    def __init__(self, status: Status, error: Errors, result: str, url: str, http_status:int=None):
         self.operation = SRU_Operations.EXPLAIN.value
         self.url = url
         self.status = status.value
+        # None if no response was received
+        self.http_status = http_status
         if error:
             self.error = error.value
             return
@@ -492,17 +521,19 @@ class SRU_Result_Search(object):
 
     closing_tags_fix = "</record></srw:recordData></srw:record>"
 
-    def __init__(self, status: Status, error: Errors, result: str, record_schema: str, version:str, maximum_records: int, start_record: int, query: str, url: str):
+    def __init__(self, status: Status, error: Errors, result: str, record_schema: str, version:str, maximum_records: int, start_record: int, query: str, url: str, http_status:int=None):
         self.operation = SRU_Operations.SEARCH.value
         self.url = url
         self.status = status.value
+        # None if no response was received
+        self.http_status = http_status
         if error:
             self.error = error.value
             return
         else:
             self.error = None
         self.result_as_string = result
-        self.result_as_parsed_xml = ET.fromstring(result)
+        self.result_as_parsed_xml = xmlb.fromstring(result)
         self.result = self.result_as_parsed_xml
         
         # Original query parameters
@@ -531,10 +562,10 @@ class SRU_Result_Search(object):
 
     def get_nb_results(self):
         """Returns the number of results as an int."""
-        if self.result_as_parsed_xml.findall(f"zs{self.version}:numberOfRecords", XML_NS):
+        if xmlb.get_sru_nb_results(self.result_as_parsed_xml, self.version) is not None:
             # Abes SRU crashed FCR because numberofrecords return None
             try:
-                return int(self.result_as_parsed_xml.find(f"zs{self.version}:numberOfRecords", XML_NS).text)
+                return int(xmlb.get_sru_nb_results(self.result_as_parsed_xml, self.version).text)
             except:
                 return 0
         else: 
@@ -542,13 +573,14 @@ class SRU_Result_Search(object):
 
     def get_records(self):
         """Returns all records as a list"""
-        return self.result_as_parsed_xml.findall(f".//zs{self.version}:record", XML_NS)
+        return xmlb.get_sru_records(self.result_as_parsed_xml, self.version)
     
     def get_records_id(self):
-        """Returns all records as a list of strings"""
-        records = self.get_records()
+        """Returns the 001 of all records as a list of strings, None for records without one"""
+        records = self.records
         output = []
         for record in records:
             # Controlfield 001 search
-            output.append(record.find(".//marc:controlfield[@tag='001']", XML_NS).text)
+            node = xmlb.get_controlfield(record, "001")
+            output.append(node.text if node is not None else None)
         return output
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+import asyncio
+from typing import List
+import aiohttp
+
+# Internal import
+from api.Koha_SRU import Koha_SRU, SRU_Version, SRU_Record_Schemas, SRU_Result_Search, SRU_Result_Explain, SRU_Operations, Status, Errors
+
+# Asyncio counterpart of Koha_SRU.search(), using aiohttp
+# Queries are still built with Koha_SRU.generate_query() & Part_Of_Query
+
+# See README.md for more informations
+
+# --------------- Class Objects ---------------
+
+class Koha_SRU_Async(Koha_SRU):
+    """Koha_SRU_Async
+    =======
+    Same as Koha_SRU, but search() & explain() are coroutines & at most max_concurrency requests are sent at once
+    Must be used as an async context manager (or close() must be awaited) :
+        async with Koha_SRU_Async(url, SRU_Version.V1_1) as sru:
+            res = await sru.search(query)
+    On init take as arguments :
+        - Koha server URL
+        - the version (defaults to 2.0)
+        - [optional] max_concurrency {int} : maximum number of requests in flight, defaults to 50
+        - [optional] service {str} : Name of the service for the logs"""
+    def __init__(self, url:str, version:SRU_Version.V1_1, max_concurrency:int=50, service="Koha_SRU_Async"):
+        super().__init__(url, version, service)
+        self.max_concurrency = max(1, max_concurrency)
+        self.semaphore:asyncio.Semaphore = None
+
+    def new_session(self) -> aiohttp.ClientSession:
+        """No session until open() is called from a running event loop"""
+        return None
+
+    def set_pool_size(self, size:int):
+        """Sets max_concurrency, the maximum number of requests in flight & of connections kept alive.
+        Raises a RuntimeError if the session is open, as its connector limit can not change"""
+        if self.session is not None and not self.session.closed:
+            raise RuntimeError("Koha_SRU_Async pool size must be set before the session is opened")
+        self.max_concurrency = max(1, size)
+
+    async def __aenter__(self):
+        self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def open(self):
+        """Creates the HTTP session, must be called from a running event loop"""
+        if self.session is None or self.session.closed:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_concurrency))
+
+    async def close(self):
+        """Closes the HTTP session"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def search(self, query:str, record_schema=SRU_Record_Schemas.MARCXML, start_record=1, maximum_records=100):
+        """GET a search retrieve request from the SRU and returns a SRU_Result_Search instance
+        Takes the same arguments as Koha_SRU.search()"""
+        self.open()
+        query, record_schema, start_record, maximum_records, url = self.generate_search_url(query, record_schema, start_record, maximum_records)
+        status = None
+        error_msg = None
+        result = ""
+        http_status = None
+
+        # Request
+        async with self.semaphore:
+            try:
+                async with self.session.get(url) as r:
+                    content = await r.read()
+                    http_status = r.status
+                    if r.status >= 400:
+                        status = Status.ERROR
+                        error_msg = Errors.HTTP_ERROR
+                        self.logger.error(f"{query} :: Koha_SRU_Async Search Retrieve :: HTTP Status: {r.status} || Method: {r.method} || URL: {r.url} || Response: {content.decode('utf-8', errors='replace')}")
+                    else:
+                        status = Status.SUCCESS
+                        self.logger.debug(f"{query} :: Koha_SRU_Async Search Retrieve :: Success")
+                        result = content.decode('utf-8')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as generic_error:
+                status = Status.ERROR
+                error_msg = Errors.GENERIC
+                self.logger.error(f"{query} :: Koha_SRU_Async Search Retrieve :: Generic exception || URL: {url} || {generic_error}")
+
+        # Parsing is done out of the semaphore so the next request can start
+        return SRU_Result_Search(status, error_msg, result,
+                record_schema, self.version, maximum_records,
+                start_record, query, url, http_status)
+
+    async def explain(self) -> SRU_Result_Explain:
+        """GET an explain request from the SRU and returns a SRU_Result_Explain instance"""
+        self.open()
+        url = f'{self.endpoint}?operation={SRU_Operations.EXPLAIN.value}&version={self.version}'
+        status = None
+        error_msg = None
+        result = ""
+        http_status = None
+
+        # Request
+        async with self.semaphore:
+            try:
+                async with self.session.get(url) as r:
+                    content = await r.read()
+                    http_status = r.status
+                    if r.status >= 400:
+                        status = Status.ERROR
+                        error_msg = Errors.HTTP_ERROR
+                        self.logger.error(f"Explain :: Koha_SRU_Async Explain :: HTTP Status: {r.status} || Method: {r.method} || URL: {r.url} || Response: {content.decode('utf-8', errors='replace')}")
+                    else:
+                        status = Status.SUCCESS
+                        self.logger.debug(f"Explain :: Koha_SRU_Async Explain :: Success")
+                        result = content.decode('utf-8')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as generic_error:
+                status = Status.ERROR
+                error_msg = Errors.GENERIC
+                self.logger.error(f"Explain :: Koha_SRU_Async Explain :: Generic exception || URL: {url} || {generic_error}")
+
+        return SRU_Result_Explain(status, error_msg, result, url, http_status)
+
+    async def search_many(self, queries:List[str], record_schema=SRU_Record_Schemas.MARCXML, start_record=1, maximum_records=100) -> List[SRU_Result_Search]:
+        """Searches all queries concurrently and returns the results in the same order"""
+        return await asyncio.gather(*[self.search(query, record_schema, start_record, maximum_records) for query in queries])
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+from collections import deque
+from enum import Enum
+import logging
+import statistics
+import threading
+import time
+from typing import List
+
+# Internal import
+import api.Koha_SRU as ksru
+
+# Spreads search retrieve requests on several Koha SRU endpoints (ex : read replicas)
+# Failing endpoints (no response, timeout or 5xx) are taken out of rotation for a while, then tried again
+# Errors caused by the query (4xx) are returned as is, without trying other endpoints
+# Queries are built like with Koha_SRU, results are the same SRU_Result_Search
+
+# See README.md for more informations
+
+# --------------- Enums ---------------
+
+class Routing_Strategies(Enum):
+    ROUND_ROBIN = "round_robin"
+    LEAST_OUTSTANDING = "least_outstanding"
+
+# Number of latencies kept per endpoint to compute the percentiles
+LATENCY_SAMPLES = 1000
+
+# --------------- Functions ---------------
+
+def is_endpoint_failure(res:ksru.SRU_Result_Search|ksru.SRU_Result_Explain) -> bool:
+    """Returns if the request failed because of the endpoint (no response, timeout or 5xx) rather than the query"""
+    if res.status == ksru.Status.SUCCESS.value:
+        return False
+    return res.http_status is None or res.http_status >= 500
+
+# --------------- Class Objects ---------------
+
+class SRU_Endpoint(object):
+    """SRU_Endpoint
+    =======
+    A Koha_SRU instance with its health & its latency stats.
+    Only edited by Koha_SRU_Pool while holding its lock"""
+    def __init__(self, sru:ksru.Koha_SRU) -> None:
+        self.sru = sru
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.down_until = 0
+        # Stats
+        self.nb_requests = 0
+        self.nb_errors = 0
+        self.nb_times_down = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.total_latency = 0
+        self.max_latency = 0
+
+    def is_up(self, now:float) -> bool:
+        """Returns if the endpoint is in rotation"""
+        return self.down_until <= now
+
+    def accepts_requests(self, now:float, max_failures:int) -> bool:
+        """Returns if a request can be sent : back in rotation after failures, a single request probes it"""
+        if not self.is_up(now):
+            return False
+        return self.consecutive_failures < max_failures or self.outstanding == 0
+
+    def to_dict(self, now:float) -> dict:
+        """Returns the stats of the endpoint (latencies in ms)"""
+        latencies = sorted(self.latencies)
+        nb_successes = self.nb_requests - self.nb_errors
+        return {
+            "url":self.sru.endpoint,
+            "up":self.is_up(now),
+            "outstanding":self.outstanding,
+            "requests":self.nb_requests,
+            "errors":self.nb_errors,
+            "times_down":self.nb_times_down,
+            "mean_ms":round(self.total_latency / nb_successes * 1000, 1) if nb_successes else None,
+            "median_ms":round(statistics.median(latencies) * 1000, 1) if latencies else None,
+            "p95_ms":round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1) if latencies else None,
+            "max_ms":round(self.max_latency * 1000, 1) if latencies else None
+        }
+
+class Koha_SRU_Pool(object):
+    """Koha_SRU_Pool
+    =======
+    Same functions than Koha_SRU to query several Koha SRU endpoints serving the same catalogue.
+    A request failing because of the endpoint is sent again to the next endpoint in rotation, until every endpoint was tried.
+    Errors caused by the query (4xx) are returned right away & do not count as endpoint failures.
+    On init take as arguments :
+        - urls {List[str]} : Koha servers URL
+        - the version (defaults to 2.0)
+        - [optional] routing {Routing_Strategies} : how the endpoint of each request is chosen, defaults to the one with the least requests running
+        - [optional] max_failures {int} : number of consecutive failures before an endpoint is taken out of rotation
+        - [optional] cooldown {float} : seconds before an endpoint out of rotation is tried again
+        - [optional] service {str} : Name of the service for the logs"""
+    def __init__(self, urls:List[str], version:ksru.SRU_Version.V1_1, routing:Routing_Strategies=Routing_Strategies.LEAST_OUTSTANDING,
+            max_failures:int=3, cooldown:float=30, service="Koha_SRU_Pool"):
+        self.endpoints = [SRU_Endpoint(ksru.Koha_SRU(url, version, service=service)) for url in urls]
+        if len(self.endpoints) == 0:
+            raise ValueError("At least one Koha URL is needed")
+        self.version = self.endpoints[0].sru.version
+        self.routing = Routing_Strategies(routing)
+        self.max_failures = max(1, max_failures)
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.next_index = 0
+        # logs
+        self.logger = logging.getLogger(service)
+        self.service = service
+
+    def set_pool_size(self, size:int):
+        """Keeps up to size connections alive per endpoint, for threads sharing this instance"""
+        for endpoint in self.endpoints:
+            endpoint.sru.set_pool_size(size)
+
+    def acquire_endpoint(self, excluded:List[SRU_Endpoint]) -> SRU_Endpoint:
+        """Returns the endpoint for the next request, and counts the request as running on it.
+        Endpoints out of rotation (or being probed) are only used if all others failed, the one back the soonest first.
+        Returns None if all endpoints are excluded"""
+        with self.lock:
+            now = time.monotonic()
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in excluded]
+            if not candidates:
+                return None
+            up = [endpoint for endpoint in candidates if endpoint.accepts_requests(now, self.max_failures)]
+            if not up:
+                endpoint = min(candidates, key=lambda endpoint: endpoint.down_until)
+            elif self.routing == Routing_Strategies.ROUND_ROBIN:
+                # Next endpoint in rotation after the last one used
+                order = self.endpoints[self.next_index:] + self.endpoints[:self.next_index]
+                endpoint = [endpoint for endpoint in order if endpoint in up][0]
+            else:
+                # Ties are broken in rotation order so idle endpoints share the load
+                order = self.endpoints[self.next_index:] + self.endpoints[:self.next_index]
+                endpoint = min([endpoint for endpoint in order if endpoint in up], key=lambda endpoint: endpoint.outstanding)
+            self.next_index = (self.endpoints.index(endpoint) + 1) % len(self.endpoints)
+            endpoint.outstanding += 1
+            endpoint.nb_requests += 1
+            return endpoint
+
+    def release_endpoint(self, endpoint:SRU_Endpoint, latency:float, healthy:bool):
+        """Records the result of a request (healthy if the endpoint answered, even with an error caused by the query),
+        taking the endpoint out of rotation after max_failures consecutive failures"""
+        with self.lock:
+            endpoint.outstanding -= 1
+            if healthy:
+                endpoint.consecutive_failures = 0
+                endpoint.down_until = 0
+                endpoint.latencies.append(latency)
+                endpoint.total_latency += latency
+                endpoint.max_latency = max(endpoint.max_latency, latency)
+                return
+            endpoint.nb_errors += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.max_failures:
+                if endpoint.is_up(time.monotonic()):
+                    endpoint.nb_times_down += 1
+                    self.logger.error(f"{endpoint.sru.endpoint} :: Koha_SRU_Pool :: Out of rotation for {self.cooldown} s after {endpoint.consecutive_failures} failures")
+                endpoint.down_until = time.monotonic() + self.cooldown
+
+    def search(self, query:str, record_schema=ksru.SRU_Record_Schemas.MARCXML, start_record=1, maximum_records=100) -> ksru.SRU_Result_Search:
+        """GET a search retrieve request from one of the SRU and returns a SRU_Result_Search instance.
+        If the endpoint fails, the request is sent to the other endpoints, the last result is returned if all failed.
+        Takes the same arguments as Koha_SRU.search()"""
+        tried = []
+        res = None
+        while True:
+            endpoint = self.acquire_endpoint(tried)
+            if endpoint is None:
+                return res
+            tried.append(endpoint)
+            start = time.perf_counter()
+            healthy = False
+            try:
+                res = endpoint.sru.search(query, record_schema=record_schema, start_record=start_record, maximum_records=maximum_records)
+                healthy = not is_endpoint_failure(res)
+            finally:
+                self.release_endpoint(endpoint, time.perf_counter() - start, healthy)
+            if healthy:
+                return res
+
+    def explain(self) -> ksru.SRU_Result_Explain:
+        """GET an explain request from the first endpoint in rotation and returns a SRU_Result_Explain instance"""
+        endpoint = self.acquire_endpoint([])
+        start = time.perf_counter()
+        res = endpoint.sru.explain()
+        self.release_endpoint(endpoint, time.perf_counter() - start, not is_endpoint_failure(res))
+        return res
+
+    def generate_search_url(self, query:str, record_schema=ksru.SRU_Record_Schemas.MARCXML, start_record=1, maximum_records=100):
+        """Same as Koha_SRU.generate_search_url(), with the first endpoint URL"""
+        return self.endpoints[0].sru.generate_search_url(query, record_schema, start_record, maximum_records)
+
+    def generate_query(self, list:list) -> str:
+        """Same as Koha_SRU.generate_query()"""
+        return self.endpoints[0].sru.generate_query(list)
+
+    def stats(self) -> List[dict]:
+        """Returns the stats of each endpoint"""
+        with self.lock:
+            now = time.monotonic()
+            return [endpoint.to_dict(now) for endpoint in self.endpoints]
+
+    def stats_as_string(self) -> str:
+        """Returns the stats of each endpoint, one line per endpoint"""
+        lines = []
+        for stats in self.stats():
+            lines.append(f"{stats['url']} : {'up' if stats['up'] else 'down'}, {stats['requests']} requests, {stats['errors']} errors, "\
+                f"{stats['times_down']} times out of rotation, latency mean {stats['mean_ms']} ms / median {stats['median_ms']} ms / p95 {stats['p95_ms']} ms / max {stats['max_ms']} ms")
+        return "\n".join(lines)
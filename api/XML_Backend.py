@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+from enum import Enum
+from typing import List
+import xml.etree.ElementTree as ET
+try:
+    from lxml import etree as LET
+except ImportError:
+    LET = None
+
+# Parses SRU responses & MARCXML records with lxml if it is installed, else with ElementTree
+# Lookups use XPath compiled once with lxml, and the same ElementPath expressions than before with ElementTree
+# Lookup functions work on both kinds of elements, whatever the backend used to parse them
+# For many lookups on the same record, index_record() collects its fields once :
+# a XPath / ElementPath call per lookup costs more than the lookup itself on small records
+
+# See README.md for more informations
+
+# --------------- Enums ---------------
+
+MARC_NS = "http://www.loc.gov/MARC21/slim"
+CONTROLFIELD_TAG = f"{{{MARC_NS}}}controlfield"
+DATAFIELD_TAG = f"{{{MARC_NS}}}datafield"
+SRU_NS = {
+    "1.1": "http://www.loc.gov/zing/srw/",
+    "1.2": "http://www.loc.gov/zing/srw/",
+    "2.0": "http://docs.oasis-open.org/ns/search-ws/sruResponse"
+    }
+NS = {
+    "marc": MARC_NS
+    }
+
+class Backends(Enum):
+    LXML = "lxml"
+    ETREE = "etree"
+
+# --------------- Compiled XPath ---------------
+
+if LET is not None:
+    LXML_ELEMENT = LET._Element
+    XPATH_CONTROLFIELD = LET.XPath(".//marc:controlfield[@tag=$tag]", namespaces=NS)
+    XPATH_DATAFIELDS = LET.XPath(".//marc:datafield[@tag=$tag]", namespaces=NS)
+    XPATH_SUBFIELDS = LET.XPath(".//marc:datafield[@tag=$tag]//marc:subfield[@code=$code]", namespaces=NS)
+    XPATH_FIELDS = LET.XPath(".//marc:controlfield|.//marc:datafield", namespaces=NS)
+    XPATH_SRU_RECORDS = {version:LET.ETXPath(f".//{{{uri}}}record") for version, uri in SRU_NS.items()}
+    XPATH_SRU_NB_RESULTS = {version:LET.ETXPath(f"{{{uri}}}numberOfRecords") for version, uri in SRU_NS.items()}
+else:
+    # Never matches an element
+    LXML_ELEMENT = type(None)
+
+# --------------- Class Objects ---------------
+
+class Indexed_Record(object):
+    """Indexed_Record
+    =======
+    A record with its fields grouped by tag, in document order.
+    Use index_record() to create one, lookup functions accept it instead of the record"""
+    __slots__ = ("record", "fields")
+
+    def __init__(self, record) -> None:
+        self.record = record
+        self.fields = {}
+        if isinstance(record, LXML_ELEMENT):
+            nodes = XPATH_FIELDS(record)
+        else:
+            nodes = [node for node in record.iter() if node.tag in [CONTROLFIELD_TAG, DATAFIELD_TAG]]
+        for node in nodes:
+            self.fields.setdefault((node.tag, node.get("tag")), []).append(node)
+
+# --------------- Functions ---------------
+
+BACKEND = Backends.LXML if LET is not None else Backends.ETREE
+
+def set_backend(backend:str|Backends) -> Backends:
+    """Chooses the backend used to parse XML, falls back to ElementTree if lxml is not installed.
+    Returns the backend in use"""
+    global BACKEND
+    BACKEND = Backends(backend) if type(backend) == str else backend
+    if LET is None:
+        BACKEND = Backends.ETREE
+    return BACKEND
+
+def fromstring(text:str|bytes):
+    """Parses a XML string with the current backend"""
+    if BACKEND == Backends.LXML:
+        # lxml refuses strings with an encoding declaration
+        if type(text) == str:
+            text = text.encode("utf-8")
+        return LET.fromstring(text)
+    return ET.fromstring(text)
+
+def index_record(record) -> Indexed_Record:
+    """Returns the record with its fields indexed by tag"""
+    if isinstance(record, Indexed_Record):
+        return record
+    return Indexed_Record(record)
+
+def get_controlfield(record, tag:str) -> object:
+    """Returns the first controlfield with this tag, None if there's none"""
+    if isinstance(record, Indexed_Record):
+        nodes = record.fields.get((CONTROLFIELD_TAG, tag))
+        return nodes[0] if nodes else None
+    elif isinstance(record, LXML_ELEMENT):
+        nodes = XPATH_CONTROLFIELD(record, tag=tag)
+        return nodes[0] if nodes else None
+    return record.find(f".//marc:controlfield[@tag='{tag}']", NS)
+
+def get_datafields(record, tag:str) -> List:
+    """Returns all datafields with this tag"""
+    if isinstance(record, Indexed_Record):
+        return list(record.fields.get((DATAFIELD_TAG, tag), []))
+    elif isinstance(record, LXML_ELEMENT):
+        return XPATH_DATAFIELDS(record, tag=tag)
+    return record.findall(f".//marc:datafield[@tag='{tag}']", NS)
+
+def get_all_subfields(record, tag:str, code:str) -> List:
+    """Returns all subfields with this code for all datafields with this tag"""
+    if isinstance(record, Indexed_Record):
+        return [subf for field in record.fields.get((DATAFIELD_TAG, tag), []) for subf in field if subf.get("code") == code]
+    elif isinstance(record, LXML_ELEMENT):
+        return XPATH_SUBFIELDS(record, tag=tag, code=code)
+    output = []
+    for field in record.findall(f".//marc:datafield[@tag='{tag}']", NS):
+        output += field.findall(f".//marc:subfield[@code='{code}']", NS)
+    return output
+
+def get_subfield(field, code:str) -> object:
+    """Returns the first subfield with this code in this datafield, None if there's none"""
+    if isinstance(field, LXML_ELEMENT):
+        # Subfields are children of the datafield, faster than a XPath call
+        for subf in field:
+            if subf.get("code") == code:
+                return subf
+        return None
+    return field.find(f".//marc:subfield[@code='{code}']", NS)
+
+def get_sru_records(result, version:str) -> List:
+    """Returns all records of a SRU search retrieve response"""
+    if isinstance(result, LXML_ELEMENT):
+        return XPATH_SRU_RECORDS[version](result)
+    return result.findall(f".//{{{SRU_NS[version]}}}record")
+
+def get_sru_nb_results(result, version:str) -> object:
+    """Returns the numberOfRecords node of a SRU search retrieve response, None if there's none"""
+    if isinstance(result, LXML_ELEMENT):
+        nodes = XPATH_SRU_NB_RESULTS[version](result)
+        return nodes[0] if nodes else None
+    return result.find(f"{{{SRU_NS[version]}}}numberOfRecords")
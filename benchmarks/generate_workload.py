@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+# Generates a synthetic UNIMARC workload to test the script at scale :
+#   - records.mrc (or records.xml) : records with 4XX fields using $9, $x & $y,
+#   targets are picked with a Zipf-like distribution so some are very frequent
+#   - export.xml : the MARCXML target records, to use as LOCAL_EXPORT_FILE
+#   or to serve with benchmarks/sru_standin.py
+#   - manual_checks.xml : manual checks matched by a share of the 4XX fields
+# Records are written as they are generated, so memory does not grow with their number
+# Usage : python benchmarks/generate_workload.py OUTPUT_DIR [options] (see --help)
+
+# external imports
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sys
+import time
+import xml.etree.ElementTree as ET
+import pymarc
+from pymarc import Subfield
+
+# Internal import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import records_io as rio
+
+# 4XX tags used by generated records (400 & 410 are often ignored, so avoid them)
+TAGS_4XX = ["411", "412", "421", "422", "423", "430", "440", "451", "461", "464", "488"]
+MANUAL_CHECK_TITLE = "Synthetic manual check {}"
+
+# --------------- Targets ---------------
+
+def target_issn(bibnb:int) -> str:
+    """Returns the ISSN of this target (odd biblionumbers are serials)"""
+    return f"{bibnb // 10000 % 10000:04d}-{bibnb % 10000:04d}"
+
+def target_isbn(bibnb:int) -> str:
+    """Returns the ISBN of this target (even biblionumbers are monographs)"""
+    return f"978-2-{bibnb // 1000 % 100000:05d}-{bibnb % 1000:03d}-X"
+
+def target_record(bibnb:int, shared_isbn:bool) -> pymarc.Record:
+    """Returns the target record for this biblionumber.
+    If shared_isbn, the record has the ISBN of the previous biblionumber too, so it is a multiple match"""
+    record = pymarc.Record(to_unicode=True, force_utf8=True)
+    record.leader = pymarc.Leader("00000nam  2200000   450 ")
+    record.add_field(pymarc.Field(tag="001", data=str(bibnb)))
+    if bibnb % 2:
+        record.add_field(pymarc.Field(tag="011", indicators=[" ", " "], subfields=[Subfield("a", target_issn(bibnb))]))
+    else:
+        record.add_field(pymarc.Field(tag="010", indicators=[" ", " "], subfields=[Subfield("a", target_isbn(bibnb))]))
+        if shared_isbn:
+            record.add_field(pymarc.Field(tag="010", indicators=[" ", " "], subfields=[Subfield("a", target_isbn(bibnb - 2))]))
+    record.add_field(pymarc.Field(tag="200", indicators=["1", " "], subfields=[
+        Subfield("a", f"Synthetic title {bibnb}"),
+        Subfield("f", f"Author {bibnb % 997}")
+        ]))
+    record.add_field(pymarc.Field(tag="210", indicators=[" ", " "], subfields=[
+        Subfield("a", "Paris"),
+        Subfield("c", f"Publisher {bibnb % 101}"),
+        Subfield("d", str(1950 + bibnb % 75))
+        ]))
+    record.add_field(pymarc.Field(tag="215", indicators=[" ", " "], subfields=[Subfield("a", f"{bibnb % 500 + 20} p.")]))
+    record.add_field(pymarc.Field(tag="700", indicators=[" ", "1"], subfields=[
+        Subfield("a", f"Author {bibnb % 997}"),
+        Subfield("b", "Jane"),
+        Subfield("4", "070")
+        ]))
+    return record
+
+def write_export(file_path:str, nb_targets:int, multiple_share:float, rand:random.Random):
+    """Writes the targets in a MARCXML file"""
+    with open(file_path, "wb") as f:
+        writer = rio.MARCXML_Writer(f)
+        for bibnb in range(1, nb_targets + 1):
+            shared_isbn = bibnb % 2 == 0 and bibnb > 2 and rand.random() < multiple_share
+            writer.write(target_record(bibnb, shared_isbn))
+        writer.close(close_fh=False)
+
+def write_manual_checks(file_path:str, nb_checks:int, nb_targets:int):
+    """Writes the manual checks file, check n°i targets biblionumber i"""
+    root = ET.Element("checks")
+    for index in range(1, nb_checks + 1):
+        check = ET.SubElement(root, "check", {"bibnb":str(min(index, nb_targets))})
+        subfield = ET.SubElement(check, "subfield", {"code":"t", "normalised":"1"})
+        subfield.text = MANUAL_CHECK_TITLE.format(index)
+    ET.indent(root, space="    ")
+    ET.ElementTree(root).write(file_path, encoding="utf-8")
+
+# --------------- Records ---------------
+
+class Workload_Generator(object):
+    """Workload_Generator
+    =======
+    Generates records with 4XX fields pointing to the targets.
+    Targets ranks follow a Zipf-like distribution : rank r is picked with a weight of 1 / r ** zipf"""
+    def __init__(self, args:argparse.Namespace, rand:random.Random) -> None:
+        self.args = args
+        self.rand = rand
+        # Shuffles ranks so frequent targets are not always the first biblionumbers
+        self.targets = list(range(1, args.targets + 1))
+        rand.shuffle(self.targets)
+        self.cum_weights = list(itertools.accumulate([1 / rank ** args.zipf for rank in range(1, args.targets + 1)]))
+
+    def pick_target(self) -> int:
+        """Returns a target biblionumber"""
+        position = bisect.bisect(self.cum_weights, self.rand.random() * self.cum_weights[-1])
+        return self.targets[min(position, len(self.targets) - 1)]
+
+    def invalid_id(self) -> str:
+        """Returns an identifier matching no target, malformed half of the time"""
+        if self.rand.random() < 0.5:
+            return self.rand.choice(["n/a", "???", "x", "0000-000", "ISBN unknown"])
+        return str(self.args.targets + self.rand.randint(1, 1000000))
+
+    def field(self) -> pymarc.Field:
+        """Returns a 4XX field"""
+        args = self.args
+        bibnb = self.pick_target()
+        subfields = [Subfield("t", f"Synthetic title {bibnb}")]
+        if self.rand.random() < args.manual_share:
+            subfields = [Subfield("t", MANUAL_CHECK_TITLE.format(self.rand.randint(1, args.manual_checks)))]
+        if self.rand.random() < args.share_9:
+            subfields.append(Subfield("9", self.invalid_id() if self.rand.random() < args.invalid_share else str(bibnb)))
+        if self.rand.random() < args.share_x:
+            # Only serials have an ISSN
+            issn = target_issn(bibnb | 1) if bibnb | 1 <= args.targets else target_issn(1)
+            subfields.append(Subfield("x", self.invalid_id() if self.rand.random() < args.invalid_share else issn))
+        if self.rand.random() < args.share_y:
+            # Only monographs have an ISBN
+            isbn = target_isbn(bibnb - bibnb % 2) if bibnb > 1 else target_isbn(2)
+            subfields.append(Subfield("y", self.invalid_id() if self.rand.random() < args.invalid_share else isbn))
+        if self.rand.random() < args.share_v:
+            subfields.append(Subfield("v", f"p. {self.rand.randint(1, 999)}"))
+        return pymarc.Field(tag=self.rand.choice(TAGS_4XX), indicators=[" ", "1"], subfields=subfields)
+
+    def record(self, index:int) -> pymarc.Record:
+        """Returns the record n°index"""
+        record = pymarc.Record(to_unicode=True, force_utf8=True)
+        record.leader = pymarc.Leader("00000nam  2200000   450 ")
+        record.add_field(pymarc.Field(tag="001", data=f"{index:09d}"))
+        record.add_field(pymarc.Field(tag="200", indicators=["1", " "], subfields=[Subfield("a", f"Synthetic record {index}")]))
+        # Exponential number of fields with the wanted mean
+        nb_fields = min(int(self.rand.expovariate(1 / self.args.density) + 0.5), 50) if self.args.density > 0 else 0
+        for _ in range(nb_fields):
+            record.add_field(self.field())
+        return record
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic UNIMARC workload")
+    parser.add_argument("output_dir", help="directory where files are written (will be created)")
+    parser.add_argument("--records", type=int, default=10000, help="number of records (default : 10000)")
+    parser.add_argument("--format", choices=[e.value for e in rio.Records_Formats], default="iso2709", help="records format (default : iso2709)")
+    parser.add_argument("--density", type=float, default=3, help="mean number of 4XX fields per record (default : 3)")
+    parser.add_argument("--targets", type=int, default=10000, help="number of target records, i.e. distinct $9 (default : 10000)")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of targets frequency, 0 for uniform (default : 1.1)")
+    parser.add_argument("--share-9", type=float, default=0.3, help="share of fields with a $9 (default : 0.3)")
+    parser.add_argument("--share-x", type=float, default=0.3, help="share of fields with a $x (default : 0.3)")
+    parser.add_argument("--share-y", type=float, default=0.5, help="share of fields with a $y (default : 0.5)")
+    parser.add_argument("--share-v", type=float, default=0.1, help="share of fields with a $v (default : 0.1)")
+    parser.add_argument("--manual-checks", type=int, default=20, help="number of manual checks (default : 20)")
+    parser.add_argument("--manual-share", type=float, default=0.01, help="share of fields matching a manual check (default : 0.01)")
+    parser.add_argument("--invalid-share", type=float, default=0.02, help="share of identifiers matching no target (default : 0.02)")
+    parser.add_argument("--multiple-share", type=float, default=0.01, help="share of monographs sharing their ISBN with another one (default : 0.01)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default : 0)")
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    os.makedirs(args.output_dir, exist_ok=True)
+    start = time.perf_counter()
+    write_export(os.path.join(args.output_dir, "export.xml"), args.targets, args.multiple_share, rand)
+    write_manual_checks(os.path.join(args.output_dir, "manual_checks.xml"), args.manual_checks, args.targets)
+
+    generator = Workload_Generator(args, rand)
+    records_format = rio.Records_Formats(args.format)
+    records_path = os.path.join(args.output_dir, "records.xml" if records_format == rio.Records_Formats.MARCXML else "records.mrc")
+    writer = rio.get_writer(records_path, records_format)
+    for index in range(1, args.records + 1):
+        writer.write(generator.record(index))
+    rio.close_writer(writer, records_path)
+    print(f"{args.records} records & {args.targets} targets written in {args.output_dir} in {time.perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# Stand-in for the Koha SRU, answering search retrieve requests (version 1.1, MARCXML)
+# from a local export, like the one written by benchmarks/generate_workload.py
+# Each request can be delayed to simulate the latency of a real instance
+# Usage : python benchmarks/sru_standin.py EXPORT_FILE [port] [latency in seconds]
+# then set KOHA_URL to http://127.0.0.1:[port]/
+# GET /count returns the number of search requests received
+
+# external imports
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import os
+import sys
+import threading
+import time
+import urllib.parse
+import xml.etree.ElementTree as ET
+
+# Internal import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import api.XML_Backend as xmlb
+import api.Koha_Local_Export as klex
+
+SRU_NS = xmlb.SRU_NS["1.1"]
+
+def search_response(export:klex.Koha_Local_Export, query:str, maximum_records:int) -> bytes:
+    """Returns the search retrieve response for this query"""
+    res = export.search(query, maximum_records=maximum_records)
+    nb_results = 0
+    records = []
+    if res.get_status() == klex.Status.SUCCESS.value:
+        nb_results = res.get_nb_results()
+        for record in res.get_records():
+            record = ET.tostring(record, encoding="unicode") if isinstance(record, ET.Element) else xmlb.LET.tostring(record, encoding="unicode")
+            records.append(f"<zs:record><zs:recordSchema>marcxml</zs:recordSchema><zs:recordPacking>xml</zs:recordPacking><zs:recordData>{record}</zs:recordData></zs:record>")
+    return (f'<?xml version="1.0" encoding="UTF-8"?>\n<zs:searchRetrieveResponse xmlns:zs="{SRU_NS}"><zs:version>1.1</zs:version>'\
+        f'<zs:numberOfRecords>{nb_results}</zs:numberOfRecords><zs:records>{"".join(records)}</zs:records></zs:searchRetrieveResponse>').encode("utf-8")
+
+def make_handler(export:klex.Koha_Local_Export, latency:float) -> type:
+    """Returns the request handler class"""
+    counter = {"requests":0}
+    lock = threading.Lock()
+
+    class SRU_Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            return
+
+        def send_body(self, body:bytes, content_type:str):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path == "/count":
+                self.send_body(str(counter["requests"]).encode("utf-8"), "text/plain")
+                return
+            params = urllib.parse.parse_qs(url.query)
+            with lock:
+                counter["requests"] += 1
+            time.sleep(latency)
+            maximum_records = int(params.get("maximumRecords", ["10"])[0])
+            self.send_body(search_response(export, params.get("query", [""])[0], maximum_records), "text/xml; charset=utf-8")
+
+    return SRU_Handler
+
+if __name__ == "__main__":
+    export = klex.Koha_Local_Export(sys.argv[1])
+    export.load()
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(export, latency))
+    print(f"Serving {len(export.records)} records on http://127.0.0.1:{port}/ with {latency} s latency", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# Compares ElementTree & lxml backends on a SRU search retrieve response :
+# parsing, then extracting the nodes used to generate 4XX subfields,
+# with one lookup per call (previous behaviour) & with index_record()
+# Usage : python benchmarks/xml_backend.py [SRU response file] [iterations]
+
+# external imports
+import os
+import sys
+import time
+
+# Internal import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import api.XML_Backend as xmlb
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "fixtures", "sru_search_response.xml")
+
+# Lookups done by generate_4XX_subfields()
+DATAFIELDS = ["700", "702", "710", "701", "712", "010"]
+SUBFIELDS = [
+    ("200", "f"), ("210", "a"), ("210", "d"), ("205", "a"), ("200", "h"), ("225", "h"), ("500", "h"),
+    ("200", "i"), ("225", "i"), ("500", "i"), ("200", "d"), ("210", "c"), ("200", "e"), ("215", "a"),
+    ("200", "a"), ("225", "a"), ("500", "a"), ("856", "u"), ("225", "v"), ("011", "y"), ("011", "z"),
+    ("011", "a"), ("010", "a"), ("013", "a")
+    ]
+
+def run(backend:xmlb.Backends, response:str, iterations:int, indexed:bool) -> tuple:
+    """Returns the parsing time & the extraction time for this backend in seconds"""
+    xmlb.set_backend(backend)
+    parsing = 0
+    extraction = 0
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = xmlb.fromstring(response)
+        parsing += time.perf_counter() - start
+
+        start = time.perf_counter()
+        for record in xmlb.get_sru_records(result, "1.1"):
+            if indexed:
+                record = xmlb.index_record(record)
+            xmlb.get_controlfield(record, "001")
+            for tag in DATAFIELDS:
+                for field in xmlb.get_datafields(record, tag):
+                    for code in "abcdef":
+                        xmlb.get_subfield(field, code)
+            for tag, code in SUBFIELDS:
+                xmlb.get_all_subfields(record, tag, code)
+        extraction += time.perf_counter() - start
+    return parsing, extraction
+
+if __name__ == "__main__":
+    file_path = sys.argv[1] if len(sys.argv) > 1 else FIXTURE
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with open(file_path, mode="r", encoding="utf-8") as f:
+        response = f.read()
+
+    results = {}
+    for backend in xmlb.Backends:
+        if xmlb.set_backend(backend) != backend:
+            print(f"{backend.value} : not installed")
+            continue
+        for indexed in [False, True]:
+            results[(backend, indexed)] = run(backend, response, iterations, indexed)
+            parsing, extraction = results[(backend, indexed)]
+            print(f"{backend.value}{' + index' if indexed else ''} : parsing {parsing / iterations * 1000:.3f} ms, "\
+                f"extraction {extraction / iterations * 1000:.3f} ms, total {(parsing + extraction) / iterations * 1000:.3f} ms per response")
+
+    # Previous behaviour : ElementTree with one lookup per call
+    reference = sum(results[(xmlb.Backends.ETREE, False)])
+    for (backend, indexed), times in results.items():
+        print(f"Gain {backend.value}{' + index' if indexed else ''} : x{reference / sum(times):.2f}")
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+from collections import OrderedDict
+from enum import Enum
+import pickle
+import sqlite3
+import sys
+import threading
+from typing import Any, Hashable
+
+def estimate_size(obj:Any) -> int:
+    """Returns an estimation of the memory used by this object in bytes.
+    Follows tuples, lists & slots, shared objects are counted each time"""
+    if obj is None or isinstance(obj, Enum):
+        return 0
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (tuple, list)):
+        size += sum([estimate_size(elem) for elem in obj])
+    elif hasattr(obj, "__slots__"):
+        size += sum([estimate_size(getattr(obj, attr, None)) for attr in obj.__slots__])
+    return size
+
+class Bounded_Cache(object):
+    """Bounded_Cache
+    =======
+    A key → value cache keeping at most max_memory bytes (estimated) in memory.
+    Least recently used entries are evicted first, then spilled to a SQLite file if one is provided
+    and loaded back in memory when they are requested again.
+    On init take as arguments :
+        - [optional] max_memory {int} : memory ceiling in bytes, no ceiling if None
+        - [optional] spill_file {str} : SQLite file used to store evicted entries, they are dropped if None.
+        Its content is cleared on init
+    Can be shared between threads"""
+    def __init__(self, max_memory:int=None, spill_file:str=None) -> None:
+        self.max_memory = max_memory
+        self.memory = 0
+        self.lock = threading.RLock()
+        # key → (value, size, spillable)
+        self.entries:OrderedDict[Hashable, tuple] = OrderedDict()
+        # Stats
+        self.evictions = 0
+        self.spilled = 0
+        self.faults = 0
+        # Spill store
+        self.spill_file = spill_file
+        self.db:sqlite3.Connection = None
+        if self.spill_file:
+            self.db = sqlite3.connect(self.spill_file, isolation_level=None, check_same_thread=False)
+            # It's a scratch store, no need to be safe against crashes
+            self.db.execute("PRAGMA journal_mode=OFF")
+            self.db.execute("PRAGMA synchronous=OFF")
+            self.db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB)")
+            self.db.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key:Hashable) -> bool:
+        with self.lock:
+            return key in self.entries or self.__load_spilled(key, remove=False) is not None
+
+    def get(self, key:Hashable, default:Any=None) -> Any:
+        """Returns the value for this key, loading it back from the spill file if needed"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key][0]
+            value = self.__load_spilled(key)
+            if value is None:
+                return default
+            self.faults += 1
+            self.set(key, value)
+            return value
+
+    def set(self, key:Hashable, value:Any, spillable:bool=True):
+        """Adds or replaces the value for this key, then evicts entries above the memory ceiling.
+        If spillable is False, the entry is dropped when evicted"""
+        with self.lock:
+            if key in self.entries:
+                self.memory -= self.entries[key][1]
+            size = 0
+            if self.max_memory is not None:
+                size = estimate_size(key) + estimate_size(value)
+            self.entries[key] = (value, size, spillable)
+            self.entries.move_to_end(key)
+            self.memory += size
+            self.evict()
+
+    def evict(self):
+        """Evicts least recently used entries until memory is below the ceiling"""
+        if self.max_memory is None:
+            return
+        with self.lock:
+            # Always keeps the last entry
+            while self.memory > self.max_memory and len(self.entries) > 1:
+                key, (value, size, spillable) = self.entries.popitem(last=False)
+                self.memory -= size
+                self.evictions += 1
+                if spillable and self.db is not None:
+                    self.db.execute("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", (repr(key), pickle.dumps(value)))
+                    self.spilled += 1
+
+    def __load_spilled(self, key:Hashable, remove:bool=True) -> Any:
+        """Returns the spilled value for this key, None if it was not spilled"""
+        if self.db is None:
+            return None
+        row = self.db.execute("SELECT value FROM cache WHERE key = ?", (repr(key),)).fetchone()
+        if row is None:
+            return None
+        if remove:
+            self.db.execute("DELETE FROM cache WHERE key = ?", (repr(key),))
+        return pickle.loads(row[0])
+
+    def stats_as_string(self) -> str:
+        """Returns the cache stats as a string"""
+        return f"{len(self.entries)} entries in memory ({self.memory} bytes estimated), "\
+            f"{self.evictions} evictions, {self.spilled} spilled to disk, {self.faults} loaded back from disk"
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+from enum import Enum
+import gzip
+import io
+import os
+import queue
+import sys
+import threading
+from typing import BinaryIO, TextIO
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Opens files compressed with gzip or zstd like plain files, streaming :
+#   - reading : the compression is detected from the first bytes, so it works with stdin too
+#   - writing : the compression is chosen from the extension (.gz, .zst)
+# zstd requires the zstandard package, only if a zstd file is used
+# If set_threaded(True) was called, (de)compression runs in a background thread,
+# overlapping it with the processing of records
+
+# See README.md for more informations
+
+# --------------- Enums ---------------
+
+class Compressions(Enum):
+    NONE = "none"
+    GZIP = "gzip"
+    ZSTD = "zstd"
+
+COMPRESSIONS_EXTENSIONS = {
+    ".gz":Compressions.GZIP,
+    ".gzip":Compressions.GZIP,
+    ".zst":Compressions.ZSTD,
+    ".zstd":Compressions.ZSTD
+}
+MAGIC_NUMBERS = {
+    Compressions.GZIP:b"\x1f\x8b",
+    Compressions.ZSTD:b"\x28\xb5\x2f\xfd"
+}
+MAGIC_NUMBER_SIZE = max([len(magic_number) for magic_number in MAGIC_NUMBERS.values()])
+# Levels used by the gzip & zstd command line tools
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+BLOCK_SIZE = 1024*1024
+# Number of blocks waiting between the background thread & the processing
+MAX_PENDING_BLOCKS = 8
+
+THREADED = False
+
+def set_threaded(threaded:bool):
+    """Chooses if files opened afterwards are (de)compressed in a background thread"""
+    global THREADED
+    THREADED = threaded
+
+# --------------- Background threads ---------------
+
+class Background_Reader(io.RawIOBase):
+    """Background_Reader
+    =======
+    Reads blocks of the stream in a background thread.
+    On init takes as argument the (decompressing) binary stream, closed with this reader"""
+    def __init__(self, stream:BinaryIO) -> None:
+        self.stream = stream
+        self.queue = queue.Queue(maxsize=MAX_PENDING_BLOCKS)
+        self.block = b""
+        self.position = 0
+        self.error:BaseException = None
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.__run, name="Background_Reader", daemon=True)
+        self.thread.start()
+
+    def __run(self):
+        """Queues blocks until the end of the stream (empty block)"""
+        try:
+            while not self.stop.is_set():
+                block = self.stream.read(BLOCK_SIZE)
+                self.queue.put(block)
+                if not block:
+                    return
+        except BaseException as generic_error:
+            self.error = generic_error
+            self.queue.put(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.block is None:
+            return 0
+        if self.position >= len(self.block):
+            self.block = self.queue.get()
+            self.position = 0
+            if not self.block:
+                self.block = None
+                if self.error:
+                    raise self.error
+                return 0
+        size = min(len(buffer), len(self.block) - self.position)
+        buffer[:size] = self.block[self.position:self.position + size]
+        self.position += size
+        return size
+
+    def close(self):
+        if self.closed:
+            return
+        self.stop.set()
+        # Unblocks the thread if the queue is full
+        while self.thread.is_alive():
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.stream.close()
+        super().close()
+
+class Background_Writer(io.BufferedIOBase):
+    """Background_Writer
+    =======
+    Writes blocks in the stream in a background thread.
+    On init takes as argument the (compressing) binary stream, closed with this writer"""
+    def __init__(self, stream:BinaryIO) -> None:
+        self.stream = stream
+        self.queue = queue.Queue(maxsize=MAX_PENDING_BLOCKS)
+        self.buffer = bytearray()
+        self.error:BaseException = None
+        self.thread = threading.Thread(target=self.__run, name="Background_Writer", daemon=True)
+        self.thread.start()
+
+    def __run(self):
+        """Writes queued blocks until close() is called"""
+        while True:
+            block = self.queue.get()
+            try:
+                if block is None:
+                    return
+                if self.error is None:
+                    self.stream.write(block)
+            except BaseException as generic_error:
+                self.error = generic_error
+            finally:
+                self.queue.task_done()
+
+    def __raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.__raise_error()
+        self.buffer += data
+        if len(self.buffer) >= BLOCK_SIZE:
+            self.queue.put(bytes(self.buffer))
+            self.buffer.clear()
+        return len(data)
+
+    def flush(self):
+        """Waits until everything written so far is in the stream"""
+        if self.closed:
+            return
+        if self.buffer:
+            self.queue.put(bytes(self.buffer))
+            self.buffer.clear()
+        self.queue.join()
+        self.__raise_error()
+        self.stream.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            # Flushes
+            super().close()
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+            self.stream.close()
+
+class Prefixed_Reader(io.RawIOBase):
+    """Prefixed_Reader
+    =======
+    Reads bytes already read from the stream, then the rest of the stream.
+    On init takes as arguments the bytes read, the stream and if the stream is closed with this reader"""
+    def __init__(self, prefix:bytes, stream:BinaryIO, close_stream:bool=True) -> None:
+        self.prefix = memoryview(prefix)
+        self.stream = stream
+        self.close_stream = close_stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if len(self.prefix) > 0:
+            size = min(len(buffer), len(self.prefix))
+            buffer[:size] = self.prefix[:size]
+            self.prefix = self.prefix[size:]
+            return size
+        # Returns what is available, like a pipe would
+        return getattr(self.stream, "readinto1", self.stream.readinto)(buffer)
+
+    def close(self):
+        if self.closed:
+            return
+        if self.close_stream:
+            self.stream.close()
+        super().close()
+
+# --------------- Functions ---------------
+
+def make_peekable(file_handle:BinaryIO, size:int, close_file:bool=True) -> BinaryIO:
+    """Returns a stream reading file_handle whose peek(size) returns size bytes, unless the stream is shorter.
+    peek() only reads from a pipe if nothing is buffered, so it can return a single byte.
+    If close_file is False, file_handle is left open when the returned stream is closed"""
+    if len(file_handle.peek(size)) >= size:
+        return file_handle
+    # read() waits for size bytes or the end of the stream
+    prefix = file_handle.read(size)
+    return io.BufferedReader(Prefixed_Reader(prefix, file_handle, close_file), BLOCK_SIZE)
+
+def get_compression_by_extension(path:str) -> Compressions:
+    """Returns the compression matching the path extension"""
+    return COMPRESSIONS_EXTENSIONS.get(os.path.splitext(path)[1].lower(), Compressions.NONE)
+
+def strip_compression_extension(path:str) -> str:
+    """Returns the path without its compression extension (ex : records.mrc.gz → records.mrc)"""
+    if get_compression_by_extension(path) != Compressions.NONE:
+        return os.path.splitext(path)[0]
+    return path
+
+def detect_compression(file_handle:BinaryIO) -> Compressions:
+    """Returns the compression of the stream based on its first bytes, without consuming them.
+    The stream must support peek(), returning all the bytes asked for (see make_peekable())"""
+    start = file_handle.peek(MAGIC_NUMBER_SIZE)[:MAGIC_NUMBER_SIZE]
+    for compression, magic_number in MAGIC_NUMBERS.items():
+        if start.startswith(magic_number):
+            return compression
+    return Compressions.NONE
+
+def get_zstandard():
+    """Returns the zstandard module, raises an ImportError if it is not installed"""
+    if zstandard is None:
+        raise ImportError("zstandard must be installed to read or write zstd files")
+    return zstandard
+
+def decompress_stream(file_handle:BinaryIO, close_file:bool=True) -> BinaryIO:
+    """Returns a binary stream supporting peek() reading the decompressed file_handle content.
+    If close_file is False, file_handle is left open when the stream is closed"""
+    file_handle = make_peekable(file_handle, MAGIC_NUMBER_SIZE, close_file)
+    compression = detect_compression(file_handle)
+    if compression == Compressions.NONE:
+        return file_handle
+    if compression == Compressions.GZIP:
+        stream = gzip.GzipFile(fileobj=file_handle, mode="rb")
+        if close_file:
+            # GzipFile never closes a file object it was given
+            stream.myfileobj = file_handle
+    else:
+        stream = get_zstandard().ZstdDecompressor().stream_reader(file_handle, read_across_frames=True, closefd=close_file)
+    if THREADED:
+        stream = Background_Reader(stream)
+    return io.BufferedReader(stream, BLOCK_SIZE)
+
+def compress_stream(file_handle:BinaryIO, compression:Compressions) -> BinaryIO:
+    """Returns a binary stream compressing what is written in file_handle, closing it when it is closed"""
+    if compression == Compressions.NONE:
+        return file_handle
+    if compression == Compressions.GZIP:
+        stream = gzip.GzipFile(fileobj=file_handle, mode="wb", compresslevel=GZIP_LEVEL)
+        stream.myfileobj = file_handle
+    else:
+        stream = get_zstandard().ZstdCompressor(level=ZSTD_LEVEL).stream_writer(file_handle, closefd=True)
+    if THREADED:
+        stream = Background_Writer(stream)
+    return stream
+
+def open_input(path:str) -> BinaryIO:
+    """Returns a binary stream supporting peek() reading the file, decompressed if needed"""
+    return decompress_stream(open(path, "rb"))
+
+def open_output(path:str) -> BinaryIO:
+    """Returns a binary stream writing the file, compressed if its extension is a compression one"""
+    return compress_stream(open(path, "wb"), get_compression_by_extension(path))
+
+def open_stdin() -> BinaryIO:
+    """Returns a binary stream reading stdin, decompressed if needed. Closing it does not close stdin"""
+    return decompress_stream(sys.stdin.buffer, close_file=False)
+
+def open_text_input(path:str) -> TextIO:
+    """Returns a UTF-8 text stream reading the file, decompressed if needed (for CSV files)"""
+    return io.TextIOWrapper(open_input(path), encoding="utf-8", newline="")
+
+def open_text_output(path:str) -> TextIO:
+    """Returns a UTF-8 text stream writing the file, compressed if its extension is a compression one (for CSV files)"""
+    return io.TextIOWrapper(open_output(path), encoding="utf-8", newline="")
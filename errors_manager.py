@@ -3,6 +3,11 @@
 # external imports
 from enum import Enum
 import csv
+import os
+from typing import Dict, List, TextIO, Tuple
+
+# Internal import
+import compressed_io as cio
 
 class Error_File_Headers(Enum):
         INDEX = "index"
@@ -11,6 +16,20 @@ class Error_File_Headers(Enum):
         TXT = "error_message"
         DATA = "data"
 
+class Aggregated_Error_File_Headers(Enum):
+        ERROR = "error"
+        TXT = "error_message"
+        DATA = "data"
+        COUNT = "count"
+        INDEXES = "indexes_sample"
+        IDS = "ids_sample"
+
+class Summary_File_Headers(Enum):
+        ERROR = "error"
+        TXT = "error_message"
+        COUNT = "count"
+        DISTINCT = "distinct_data"
+
 class Errors(Enum):
     CHUNK_ERROR = 0
     NO_RECORD_ID = 1
@@ -21,17 +40,56 @@ class Errors(Enum):
     SRU_MULTIPLE_MATCHES = 101
 
 
+class Aggregated_Error(object):
+    # Slots because there can be a lot of them
+    __slots__ = ("count", "indexes", "ids")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.indexes:List[str] = []
+        self.ids:List[str] = []
+
 class Errors_Manager(object):
-    def __init__(self, file_path:str) -> None:
-        self.file = open(file_path, "w", newline="", encoding='utf-8')
+    """Errors_Manager
+    =======
+    Writes errors in a CSV file.
+    On init take as arguments :
+        - file_path {str} : path to the errors file
+        - [optional] aggregate {bool} : write each distinct (error, message, data) once with an occurrence count
+        and a per error type summary file, instead of one line per occurrence
+        - [optional] max_samples {int} : number of record indexes & IDs kept as sample for aggregated errors
+        - [optional] file {TextIO} : already opened stream to write in instead of file_path.
+        It is not closed by close() and no summary file is written"""
+    def __init__(self, file_path:str, aggregate:bool=False, max_samples:int=10, file:TextIO=None) -> None:
+        self.file_path = file_path
+        self.aggregate = aggregate
+        self.max_samples = max_samples
+        self.owns_file = file is None
+        if self.owns_file:
+            self.file = cio.open_text_output(file_path)
+        else:
+            self.file = file
         self.headers = []
         for member in Error_File_Headers:
             self.headers.append(member.value)
+        if self.aggregate:
+            self.headers = [member.value for member in Aggregated_Error_File_Headers]
+            self.aggregated_errors:Dict[Tuple[Errors, str, str], Aggregated_Error] = {}
         self.writer = csv.DictWriter(self.file, extrasaction="ignore", fieldnames=self.headers, delimiter=";")
         self.writer.writeheader()
 
+    @property
+    def summary_file_path(self) -> str:
+        """Returns the path of the summary file for aggregated errors, compressed like the errors file"""
+        compression_ext = self.file_path[len(cio.strip_compression_extension(self.file_path)):]
+        root, ext = os.path.splitext(cio.strip_compression_extension(self.file_path))
+        return f"{root}_summary{ext or '.csv'}{compression_ext}"
+
     def close(self):
-        self.file.close()
+        if self.aggregate:
+            self.write_aggregated_errors()
+        if self.owns_file:
+            self.file.close()
 
     def trigger_error(self, index:int, id:str, error:Errors, txt:str, data:str):
         """Trigger an error.
@@ -43,6 +101,9 @@ class Errors_Manager(object):
             - data {str} : additionnal information (ex : data that trigger the error)"""
         if index < 0:
             index = "Ø"
+        if self.aggregate:
+            self.aggregate_error(index, id, error, txt, data)
+            return
         self.writer.writerow(
             {
                 Error_File_Headers.INDEX.value:index,
@@ -52,3 +113,49 @@ class Errors_Manager(object):
                 Error_File_Headers.DATA.value:data
             }
         )
+
+    def aggregate_error(self, index:int|str, id:str, error:Errors, txt:str, data:str):
+        """Counts an occurrence of this (error, message, data) & keeps a sample of record indexes"""
+        key = (error, txt, data)
+        if key not in self.aggregated_errors:
+            self.aggregated_errors[key] = Aggregated_Error()
+        aggregated_error = self.aggregated_errors[key]
+        aggregated_error.count += 1
+        if len(aggregated_error.indexes) < self.max_samples:
+            aggregated_error.indexes.append(str(index))
+            aggregated_error.ids.append(str(id))
+
+    def write_aggregated_errors(self):
+        """Writes all aggregated errors, then the summary per error type & message"""
+        summary:Dict[Tuple[Errors, str], List[int]] = {}
+        for (error, txt, data), aggregated_error in self.aggregated_errors.items():
+            self.writer.writerow(
+                {
+                    Aggregated_Error_File_Headers.ERROR.value:error.name,
+                    Aggregated_Error_File_Headers.TXT.value:txt,
+                    Aggregated_Error_File_Headers.DATA.value:data,
+                    Aggregated_Error_File_Headers.COUNT.value:aggregated_error.count,
+                    Aggregated_Error_File_Headers.INDEXES.value:",".join(aggregated_error.indexes),
+                    Aggregated_Error_File_Headers.IDS.value:",".join(aggregated_error.ids)
+                }
+            )
+            # [occurrences, distinct data]
+            summary.setdefault((error, txt), [0, 0])
+            summary[(error, txt)][0] += aggregated_error.count
+            summary[(error, txt)][1] += 1
+
+        if not self.file_path:
+            return
+        with cio.open_text_output(self.summary_file_path) as f:
+            writer = csv.DictWriter(f, fieldnames=[member.value for member in Summary_File_Headers], delimiter=";")
+            writer.writeheader()
+            # By error type, messages in the order they first occurred
+            for (error, txt), (count, distinct) in sorted(summary.items(), key=lambda item: item[0][0].value):
+                writer.writerow(
+                    {
+                        Summary_File_Headers.ERROR.value:error.name,
+                        Summary_File_Headers.TXT.value:txt,
+                        Summary_File_Headers.COUNT.value:count,
+                        Summary_File_Headers.DISTINCT.value:distinct
+                    }
+                )
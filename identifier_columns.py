@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+from array import array
+from typing import Dict, Iterable, List, Tuple
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Keeps the identifiers of every field of a file in compact columns (one value per field)
+# instead of keeping records : strings are stored once in a table and columns hold their codes
+# Unique / count operations use NumPy if it is installed, plain Python loops otherwise
+
+# See README.md for more informations
+
+NO_VALUE = -1
+
+class Identifier_Columns(object):
+    """Identifier_Columns
+    =======
+    Columns of identifiers extracted from fields.
+    On init take as arguments :
+        - steps {List[str]} : names of the identifiers kept for each field (ex : $9, $x & $y)
+    For each field are stored its record index, its tag, a flag (ex : matches a manual check)
+    and for each step its raw value & its key (normalised value)"""
+    def __init__(self, steps:List[str]) -> None:
+        self.steps = steps
+        self.record_indexes = array("q")
+        self.tags = array("H")
+        self.flags = array("b")
+        self.values:Dict[str, array] = {step:array("q") for step in steps}
+        self.keys:Dict[str, array] = {step:array("q") for step in steps}
+        # String table
+        self.codes:Dict[str, int] = {}
+        self.strings:List[str] = []
+        # Records stats
+        self.nb_records = 0
+        self.nb_invalid_records = 0
+        self.nb_no_id_records = 0
+
+    def __len__(self) -> int:
+        return len(self.record_indexes)
+
+    def encode(self, txt:str) -> int:
+        """Returns the code of this string, NO_VALUE for an empty string"""
+        if not txt:
+            return NO_VALUE
+        code = self.codes.get(txt)
+        if code is None:
+            code = len(self.strings)
+            self.codes[txt] = code
+            self.strings.append(txt)
+        return code
+
+    def decode(self, code:int) -> str:
+        """Returns the string of this code, an empty string for NO_VALUE"""
+        if code == NO_VALUE:
+            return ""
+        return self.strings[code]
+
+    def add_field(self, record_index:int, tag:str, flag:bool, values:List[str], keys:List[str]):
+        """Adds a field, values & keys are in steps order (empty string if missing)"""
+        self.record_indexes.append(record_index)
+        self.tags.append(int(tag))
+        self.flags.append(1 if flag else 0)
+        for step, value, key in zip(self.steps, values, keys):
+            self.values[step].append(self.encode(value))
+            self.keys[step].append(self.encode(key))
+
+    def iter_fields(self) -> Iterable[Tuple[int, str, bool, List[str]]]:
+        """Yields for each field in order a tuple (record index, tag, flag, raw values in steps order)"""
+        for position in range(len(self)):
+            yield self.record_indexes[position], str(self.tags[position]), self.flags[position] == 1,\
+                [self.decode(self.values[step][position]) for step in self.steps]
+
+    def count_unique(self, step:str, keys:bool=True) -> List[Tuple[str, int, int]]:
+        """Returns a list of tuples (value, number of fields, index of the first record) for each distinct key
+        (or raw value if keys is False) of the step, by first occurrence"""
+        column = self.keys[step] if keys else self.values[step]
+        if np is not None:
+            codes = np.frombuffer(column, dtype=np.int64) if len(column) > 0 else np.empty(0, dtype=np.int64)
+            positions = np.flatnonzero(codes != NO_VALUE)
+            unique_codes, first, counts = np.unique(codes[positions], return_index=True, return_counts=True)
+            order = np.argsort(first, kind="stable")
+            first_positions = positions[first[order]]
+            return [(self.strings[code], int(count), self.record_indexes[position])
+                for code, count, position in zip(unique_codes[order].tolist(), counts[order].tolist(), first_positions.tolist())]
+        counts:Dict[int, list] = {}
+        for position, code in enumerate(column):
+            if code == NO_VALUE:
+                continue
+            if code in counts:
+                counts[code][1] += 1
+            else:
+                counts[code] = [self.strings[code], 1, self.record_indexes[position]]
+        return [tuple(entry) for entry in counts.values()]
+
+    def rank(self, step:str, keys:bool=True, top:int=None) -> List[Tuple[str, int, int]]:
+        """Returns count_unique() sorted by descending number of fields, then by first occurrence"""
+        ranking = sorted(self.count_unique(step, keys), key=lambda entry: (-entry[1], entry[2]))
+        if top is not None:
+            return ranking[:top]
+        return ranking
+
+    def nb_flagged(self) -> int:
+        """Returns the number of flagged fields"""
+        if np is not None:
+            return int(np.count_nonzero(np.frombuffer(self.flags, dtype=np.int8))) if len(self.flags) > 0 else 0
+        return sum(self.flags)
+
+    def nbytes(self) -> int:
+        """Returns the approximate size of the columns in bytes (without the string table)"""
+        columns = [self.record_indexes, self.tags, self.flags] + list(self.values.values()) + list(self.keys.values())
+        return sum([column.itemsize * len(column) for column in columns])
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+import base64
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import json
+import logging
+import statistics
+import time
+import urllib.parse
+from typing import Callable, List
+
+# Long running local service : the caller keeps the SRU session, the manual checks
+# & the resolution caches warm, then each POST /process is a job using them
+#   - POST /process[?format=iso2709|marcxml] : body is the records (ISO2709 or MARCXML),
+#   returns the edited records, the errors as CSV & the job latency as JSON
+#   - GET /stats : cache stats & latency of the processed jobs
+# Jobs are processed one at a time, in the order they come
+
+# See README.md for more informations
+
+# Number of job latencies kept for the stats
+MAX_LATENCIES = 1000
+
+class Service_Stats(object):
+    """Service_Stats
+    =======
+    Latencies of the jobs processed by the service"""
+    def __init__(self) -> None:
+        self.started = time.time()
+        self.nb_jobs = 0
+        self.nb_records = 0
+        self.latencies:List[float] = []
+
+    def add_job(self, nb_records:int, latency:float):
+        self.nb_jobs += 1
+        self.nb_records += nb_records
+        self.latencies.append(latency)
+        if len(self.latencies) > MAX_LATENCIES:
+            self.latencies.pop(0)
+
+    def to_dict(self) -> dict:
+        output = {
+            "uptime_seconds":round(time.time() - self.started, 3),
+            "jobs":self.nb_jobs,
+            "records":self.nb_records,
+            "last_job_ms":None,
+            "mean_job_ms":None,
+            "median_job_ms":None,
+            "max_job_ms":None
+        }
+        if self.latencies:
+            output["last_job_ms"] = round(self.latencies[-1] * 1000, 3)
+            output["mean_job_ms"] = round(statistics.mean(self.latencies) * 1000, 3)
+            output["median_job_ms"] = round(statistics.median(self.latencies) * 1000, 3)
+            output["max_job_ms"] = round(max(self.latencies) * 1000, 3)
+        return output
+
+def make_handler(process_job:Callable, cache_stats:Callable, stats:Service_Stats, logger:logging.Logger, sru_stats:Callable=None) -> type:
+    """Returns the request handler class calling process_job for each job"""
+    class Service_Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def send_json(self, status:int, data:dict):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if urllib.parse.urlparse(self.path).path != "/stats":
+                self.send_json(404, {"error":"Unknown path"})
+                return
+            output = stats.to_dict()
+            output["cache"] = cache_stats()
+            if sru_stats is not None:
+                output["sru_endpoints"] = sru_stats()
+            self.send_json(200, output)
+
+        def do_POST(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path != "/process":
+                self.send_json(404, {"error":"Unknown path"})
+                return
+            output_format = urllib.parse.parse_qs(url.query).get("format", [None])[0]
+            payload = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            start = time.perf_counter()
+            try:
+                records, records_format, errors, nb_records = process_job(payload, output_format)
+            except Exception as generic_error:
+                logger.error(f"Process :: Local service :: Job failed || {generic_error}")
+                self.send_json(400, {"error":str(generic_error)})
+                return
+            latency = time.perf_counter() - start
+            stats.add_job(nb_records, latency)
+            logger.info(f"Process :: Local service :: {nb_records} records in {latency * 1000:.3f} ms")
+            output = {
+                "format":records_format.value,
+                "nb_records":nb_records,
+                "latency_ms":round(latency * 1000, 3),
+                "errors":errors
+            }
+            # ISO2709 is binary
+            if records_format.value == "marcxml":
+                output["records"] = records.decode("utf-8")
+            else:
+                output["records"] = base64.b64encode(records).decode("ascii")
+            self.send_json(200, output)
+
+    return Service_Handler
+
+def serve(host:str, port:int, process_job:Callable, cache_stats:Callable, service:str="Local_Service", sru_stats:Callable=None):
+    """Serves jobs on host:port until interrupted.
+    Takes as arguments :
+        - host {str} : address to listen on, keep it local
+        - port {int} : port to listen on
+        - process_job {Callable} : (payload, output format) → (records, format, errors as CSV, number of records)
+        - cache_stats {Callable} : returns the cache stats as a string
+        - [optional] service {str} : Name of the service for the logs
+        - [optional] sru_stats {Callable} : returns the stats of each SRU endpoint as a list of dict"""
+    logger = logging.getLogger(service)
+    stats = Service_Stats()
+    server = HTTPServer((host, port), make_handler(process_job, cache_stats, stats, logger, sru_stats))
+    print(f"Listening on http://{host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
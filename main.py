@@ -1,31 +1,67 @@
 # -*- coding: utf-8 -*- 
 
 # external imports
+import io
 import os
+import sys
 from dotenv import load_dotenv
 import re
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pymarc
 from pymarc import Subfield
 from enum import Enum
-from typing import List, Dict
+from typing import Callable, Iterable, List, Dict, Tuple
 import xml.etree.ElementTree as ET
 from unidecode import unidecode
 
 # Internal import
 import api.Koha_SRU as ksru
+import api.Koha_SRU_Pool as ksru_pool
+import api.Koha_Local_Export as klex
+import api.XML_Backend as xmlb
 import fcr_func as fcf
+import records_io as rio
+import compressed_io as cio
+import local_service
 from errors_manager import Errors_Manager, Errors
+from bounded_cache import Bounded_Cache
+from trace_writer import Trace_Writer
+from prefetcher import Prefetcher
+from identifier_columns import Identifier_Columns
+from single_flight import Single_Flight
+from resolutions_store import Resolutions_Store, Resolution, Change_Status
 
 # ---------- Init ----------
 load_dotenv()
 
 RECORDS_FILE_PATH = os.getenv("RECORDS_FILE")
 FILE_OUT = os.getenv("FILE_OUT")
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT")
 ERRORS_FILE_PATH = os.path.abspath(os.getenv("ERRORS_FILE"))
-ERR_MAN = Errors_Manager(ERRORS_FILE_PATH)
+ERR_MAN:Errors_Manager = None # Opened when main starts
+JOB = threading.local() # Errors manager of the file / job processed by this thread
+AGGREGATE_ERRORS = os.getenv("AGGREGATE_ERRORS") == "1"
 MANUAL_CHECKS_FILE = os.getenv("MANUAL_CHECKS_FILE")
 KOHA_URL = os.getenv("KOHA_URL")
-sru = ksru.Koha_SRU(KOHA_URL, ksru.SRU_Version.V1_1)
+# Several URL separated by commas spread requests on all of them
+KOHA_URLS = [url.strip() for url in (KOHA_URL or "").split(",") if url.strip()]
+LOCAL_EXPORT_FILE = os.getenv("LOCAL_EXPORT_FILE")
+LOCAL_EXPORT_PROCESSES = None
+if os.getenv("LOCAL_EXPORT_PROCESSES"):
+    LOCAL_EXPORT_PROCESSES = int(os.getenv("LOCAL_EXPORT_PROCESSES"))
+if LOCAL_EXPORT_FILE:
+    # Local export is only loaded when main starts
+    sru = klex.Koha_Local_Export(LOCAL_EXPORT_FILE, processes=LOCAL_EXPORT_PROCESSES)
+elif len(KOHA_URLS) > 1:
+    sru = ksru_pool.Koha_SRU_Pool(KOHA_URLS, ksru.SRU_Version.V1_1,
+        routing=ksru_pool.Routing_Strategies(os.getenv("KOHA_ROUTING") or ksru_pool.Routing_Strategies.LEAST_OUTSTANDING.value),
+        max_failures=int(os.getenv("KOHA_MAX_FAILURES") or 3),
+        cooldown=float(os.getenv("KOHA_COOLDOWN") or 30))
+else:
+    sru = ksru.Koha_SRU(KOHA_URL, ksru.SRU_Version.V1_1)
 IGNORE_FIELDS = os.getenv("IGNORE_FIELDS")
 ignored_fields = [ignored_field.strip() for ignored_field in IGNORE_FIELDS.split(",")]
 U4XX_list = [str(nb) for nb in range(400, 500)]
@@ -35,9 +71,53 @@ for ignored_field in ignored_fields:
 KEEP_V = False
 if os.getenv("KEEP_V") == "1":
     KEEP_V = True
-NS = {
-    'marc': 'http://www.loc.gov/MARC21/slim'
-}
+if os.getenv("XML_BACKEND"):
+    xmlb.set_backend(os.getenv("XML_BACKEND"))
+DRY_RUN = os.getenv("DRY_RUN") == "1"
+DRY_RUN_TOP = int(os.getenv("DRY_RUN_TOP") or 10)
+CACHE_MAX_MEMORY = None
+if os.getenv("CACHE_MAX_MEMORY"):
+    # Provided in MB
+    CACHE_MAX_MEMORY = int(float(os.getenv("CACHE_MAX_MEMORY")) * 1024 * 1024)
+CACHE_SPILL_FILE = os.getenv("CACHE_SPILL_FILE")
+SRU_LATENCY = float(os.getenv("SRU_LATENCY") or 0.2)
+SERVICE_HOST = os.getenv("SERVICE_HOST") or "127.0.0.1"
+SERVICE_PORT = None
+if os.getenv("SERVICE_PORT"):
+    SERVICE_PORT = int(os.getenv("SERVICE_PORT"))
+BATCH_INPUT = os.getenv("BATCH_INPUT")
+BATCH_OUTPUT_DIR = os.getenv("BATCH_OUTPUT_DIR")
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS") or 1)
+SEED_FILES = [seed_file.strip() for seed_file in (os.getenv("SEED_FILES") or "").split(",") if seed_file.strip()]
+# ISSN & ISBN seeds hide the multiple matches of records not linked in the seed files
+SEED_INTNAT_IDS = os.getenv("SEED_INTNAT_IDS") == "1"
+TRACE_FILE = os.getenv("TRACE_FILE")
+TRACER:Trace_Writer = None # Opened when main starts if TRACE_FILE is set
+PREFETCH_WINDOW = int(os.getenv("PREFETCH_WINDOW") or 0)
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS") or 8)
+PREFETCH_PLAN = os.getenv("PREFETCH_PLAN") == "1"
+if os.getenv("PATCH_ISO2709") == "1":
+    rio.set_patch_tags(U4XX_list)
+if os.getenv("COMPRESSION_THREAD") == "1":
+    cio.set_threaded(True)
+RESOLUTIONS_FILE = os.getenv("RESOLUTIONS_FILE")
+RESOLUTIONS:Resolutions_Store = None # Opened when main starts if RESOLUTIONS_FILE is set
+RESOLUTIONS_MAX_AGE = None
+if os.getenv("RESOLUTIONS_MAX_AGE"):
+    # Provided in days
+    RESOLUTIONS_MAX_AGE = float(os.getenv("RESOLUTIONS_MAX_AGE")) * 86400
+REFRESH_RESOLUTIONS = os.getenv("REFRESH_RESOLUTIONS") == "1"
+REFRESH_BATCH_SIZE = int(os.getenv("REFRESH_BATCH_SIZE") or 100)
+REFRESH_PAUSE = float(os.getenv("REFRESH_PAUSE") or 1)
+REFRESH_WORKERS = int(os.getenv("REFRESH_WORKERS") or 1)
+REFRESH_MAX_ENTRIES = None
+if os.getenv("REFRESH_MAX_ENTRIES"):
+    REFRESH_MAX_ENTRIES = int(os.getenv("REFRESH_MAX_ENTRIES"))
+REFRESH_MIN_AGE = float(os.getenv("REFRESH_MIN_AGE") or 0) * 86400 # Provided in days
+REFRESH_HOURS = None
+if os.getenv("REFRESH_HOURS"):
+    # Start & end hours, like 22-6
+    REFRESH_HOURS = tuple(int(hour) for hour in os.getenv("REFRESH_HOURS").split("-"))
 
 # ---------- Class def ----------
 # ----- Manual checks -----
@@ -86,43 +166,88 @@ class Steps(Enum):
     ISBN = 2
     LINKED_BIBLIONUMBER = 3
 
+STEPS_PRIORITY = [Steps.MANUAL_CHECK, Steps.LINKED_BIBLIONUMBER, Steps.ISSN, Steps.ISBN]
+SRU_STEPS = [step for step in STEPS_PRIORITY if step != Steps.MANUAL_CHECK]
+
+class Provenances(Enum):
+    SRU = "sru" # Queried
+    CROSS_IDENTIFIER = "cross_identifier" # Biblionumber of a record returned by the SRU
+    SEED = "seed" # Rebuilt from a previous output file
+    STORE = "store" # Loaded from the resolutions file
+
 class Known_Element(object):
-    def __init__(self, step:Steps, query:str, subfields:List[Subfield], id:str|Manual_Check) -> None:
+    # Slots & a single ID attribute keep big known lists small
+    __slots__ = ("step", "query", "subfields", "id", "normalized_id", "provenance")
+
+    def __init__(self, step:Steps, query:str, subfields:List[Subfield], id:str|Manual_Check, provenance:Provenances=Provenances.SRU) -> None:
         self.step:Steps = step
         self.query:str = query
-        self.subfields:List[Subfield] = subfields
-        self.linked_biblionumber:str = None
-        self.issn:str = None
-        self.normalized_issn:str = None
-        self.isbn:str = None
-        self.normalized_isbn:str = None
-        self.manual_check:Manual_Check = None
-        # Give ID to the corretc attribute
-        if step == Steps.MANUAL_CHECK:
-            self.manual_check = id
-        elif step == Steps.LINKED_BIBLIONUMBER:
-            self.linked_biblionumber = id
-        elif step == Steps.ISSN:
-            self.issn = id
-            # I guess I'll keep this check just in case
-            if self.issn is not None:
-                self.normalized_issn = normalize_intnat_id(self.issn, Steps.ISSN)
-        elif step == Steps.ISBN:
-            self.isbn = id
-            # I guess I'll keep this check just in case
-            if self.isbn is not None:
-                self.normalized_isbn = normalize_intnat_id(self.isbn, Steps.ISBN)
-    
+        # Identical subfields are shared between known elements
+        self.subfields:Tuple[Subfield] = intern_subfields(subfields)
+        self.id:str|Manual_Check = id
+        self.normalized_id:str = None
+        # I guess I'll keep this check just in case
+        if step in [Steps.ISSN, Steps.ISBN] and id is not None:
+            self.normalized_id = normalize_intnat_id(id, step)
+        self.provenance:Provenances = provenance
+
+    @property
+    def manual_check(self) -> Manual_Check:
+        """Returns the manual check if this element is from a manual check"""
+        return self.id if self.step == Steps.MANUAL_CHECK else None
+
+    @property
+    def linked_biblionumber(self) -> str:
+        """Returns the linked biblionumber if this element is from a $9"""
+        return self.id if self.step == Steps.LINKED_BIBLIONUMBER else None
+
+    @property
+    def issn(self) -> str:
+        """Returns the ISSN if this element is from an ISSN"""
+        return self.id if self.step == Steps.ISSN else None
+
+    @property
+    def normalized_issn(self) -> str:
+        """Returns the normalized ISSN if this element is from an ISSN"""
+        return self.normalized_id if self.step == Steps.ISSN else None
+
+    @property
+    def isbn(self) -> str:
+        """Returns the ISBN if this element is from an ISBN"""
+        return self.id if self.step == Steps.ISBN else None
+
+    @property
+    def normalized_isbn(self) -> str:
+        """Returns the normalized ISBN if this element is from an ISBN"""
+        return self.normalized_id if self.step == Steps.ISBN else None
+
     @property
     def has_link(self) -> bool:
         """Returns if this element has a $9"""
         return "9" in [subf.code for subf in self.subfields]
 
-KNOWN_LIST:List[Known_Element] = []
 MANUAL_CHECKS_KNOWN_LIST:List[Known_Element] = []
+# Holds, with a memory ceiling if CACHE_MAX_MEMORY is set :
+#   - (step name, ID / normalized ID / query) → known element
+#   - ("TARGET", biblionumber) → generated subfields for the target record
+#   - ("PAYLOAD", subfields) → the shared instance of these subfields
+#   - ("FIELD", tag, subfields, KEEP_V) → subfields replacing this field, () if it is unchanged
+# Replaced when main starts so the spill file is not opened on import
+KNOWN_CACHE = Bounded_Cache()
+# Coalesce identical SRU requests & ID lookups running in parallel threads
+SRU_SEARCHES = Single_Flight()
+SRU_LOOKUPS = Single_Flight()
 
 # ---------- Func def ----------
 
+def get_err_man() -> Errors_Manager:
+    """Returns the errors manager of the current job, ERR_MAN if none"""
+    return getattr(JOB, "err_man", None) or ERR_MAN
+
+def get_trace() -> dict:
+    """Returns the trace entry of the field processed by this thread, None if tracing is off"""
+    return getattr(JOB, "trace", None)
+
 def normalize_intnat_id(txt:str, step: Steps) -> str:
     """Returned a normalized version of an international ID"""
     if step == Steps.ISSN:
@@ -131,6 +256,16 @@ def normalize_intnat_id(txt:str, step: Steps) -> str:
         return re.sub("[^0-9X]", "", txt.upper())
     return ""
 
+def intern_subfields(subfields:List[Subfield]) -> Tuple[Subfield]:
+    """Returns the subfields as a tuple shared by all identical subfields lists"""
+    subfields = tuple(subfields)
+    payload = KNOWN_CACHE.get(("PAYLOAD", subfields))
+    if payload is None:
+        # Only used to share subfields, no need to spill them
+        KNOWN_CACHE.set(("PAYLOAD", subfields), subfields, spillable=False)
+        payload = subfields
+    return payload
+
 def normalize_check_value(txt:str) -> str:
     """Returns the strig normalized for the manual checks"""
     return unidecode(txt).upper().strip()
@@ -155,10 +290,7 @@ def generate_intnat_id_sru_query(txt:str, step:Steps):
 
 def xml_return_all_subfields(record:ET.Element, tag:str, code:str) -> List[ET.Element]:
     """Returns all subfields for all field with this tag"""
-    output = []
-    for field in record.findall(f".//marc:datafield[@tag='{tag}']", NS):
-        output += field.findall(f".//marc:subfield[@code='{code}']", NS)
-    return output
+    return xmlb.get_all_subfields(record, tag, code)
 
 def generate_4XX_author_from_7XX(field:ET.Element) -> str:
     """Returns the 7XX as a string for a 4XX$a from a 7XX"""
@@ -171,12 +303,12 @@ def generate_4XX_author_from_7XX(field:ET.Element) -> str:
     tag = field.get("tag")
 
     # Gets $a, $b, $c, $d, $f
-    a_node = field.find(".//marc:subfield[@code='a']", NS)
-    b_node = field.find(".//marc:subfield[@code='b']", NS)
-    c_node = field.find(".//marc:subfield[@code='c']", NS)
-    d_node = field.find(".//marc:subfield[@code='d']", NS)
-    e_node = field.find(".//marc:subfield[@code='e']", NS)
-    f_node = field.find(".//marc:subfield[@code='f']", NS)
+    a_node = xmlb.get_subfield(field, "a")
+    b_node = xmlb.get_subfield(field, "b")
+    c_node = xmlb.get_subfield(field, "c")
+    d_node = xmlb.get_subfield(field, "d")
+    e_node = xmlb.get_subfield(field, "e")
+    f_node = xmlb.get_subfield(field, "f")
 
     # Easy common part for 70X
     if tag in ["700", "701", "702"]:
@@ -241,8 +373,10 @@ def generate_4XX_subfields(record:ET.Element) -> List[str]:
     """Returns all subfields formatted for pymarc for the 4XX in Koha.
     It seems that Koha always go for first occurrence, so we do this"""
     output = []
+    # Lots of lookups on the same record, so collect its fields only once
+    record = xmlb.index_record(record)
     # Get bibnb ($9 & $0)
-    bibnb_node = record.find(".//marc:controlfield[@tag='001']", NS)
+    bibnb_node = xmlb.get_controlfield(record, "001")
     if bibnb_node is not None: # DON'T DO if bibnb_node, it evaluates to false as there's no children
         output.append(Subfield(code="9", value=bibnb_node.text))
         output.append(Subfield(code="0", value=bibnb_node.text))
@@ -252,19 +386,19 @@ def generate_4XX_subfields(record:ET.Element) -> List[str]:
     # I'm going to assume there's a logic I'm too lazy to write here
     # But tbh, I'm not convinced if it's that
     # First check 700
-    authors_fields = record.findall(".//marc:datafield[@tag='700']", NS)
+    authors_fields = xmlb.get_datafields(record, "700")
     # If no 700, check 702
     if len(authors_fields) == 0:
-        authors_fields += record.findall(".//marc:datafield[@tag='702']", NS) # += just in case
+        authors_fields += xmlb.get_datafields(record, "702") # += just in case
     # If no 700 or 702, check 710
     if len(authors_fields) == 0: # Not a elif
-        authors_fields += record.findall(".//marc:datafield[@tag='710']", NS) # += just in case
+        authors_fields += xmlb.get_datafields(record, "710") # += just in case
     # If no 700 or 702 or 710, check 701
     if len(authors_fields) == 0: # Not a elif
-        authors_fields += record.findall(".//marc:datafield[@tag='701']", NS) # += just in case
+        authors_fields += xmlb.get_datafields(record, "701") # += just in case
     # If no 700 or 702 or 710 or 701, check 712
     if len(authors_fields) == 0: # Not a elif
-        authors_fields += record.findall(".//marc:datafield[@tag='712']", NS) # += just in case
+        authors_fields += xmlb.get_datafields(record, "712") # += just in case
     # Add the subfield if we have a value    
     if len(authors_fields) > 0:
         author_text = generate_4XX_author_from_7XX(authors_fields[0])
@@ -390,7 +524,7 @@ def generate_4XX_subfields(record:ET.Element) -> List[str]:
     if len(isbn_nodes) > 0:
         output.append(Subfield(code="y", value=isbn_nodes[0].text))
     # If no 010$a, we check if there were 010 at all, if not, check 013$a
-    elif len(record.findall(".//marc:datafield[@tag='010']", NS)) == 0:
+    elif len(xmlb.get_datafields(record, "010")) == 0:
         ismn_nodes = xml_return_all_subfields(record, "013", "a")
         # Add the subfield if we have a value
         if len(ismn_nodes) > 0:
@@ -401,7 +535,12 @@ def generate_4XX_subfields(record:ET.Element) -> List[str]:
 
 def add_known_element(known_element:Known_Element):
     """Adds a new known element"""
-    KNOWN_LIST.append(known_element)
+    # Checked & set at once, so threads adding the same key keep the same element
+    with KNOWN_CACHE.lock:
+        for key in [known_element.id, known_element.normalized_id, known_element.query]:
+            # Keeps the first known element for a key, like the list order did
+            if key and (known_element.step.name, key) not in KNOWN_CACHE:
+                KNOWN_CACHE.set((known_element.step.name, key), known_element)
 
 def add_manual_check_known_element(known_element:Known_Element):
     """Adds a new known element"""
@@ -409,35 +548,39 @@ def add_manual_check_known_element(known_element:Known_Element):
 
 def get_known_element_by_intnat_id(id:str, step:Steps) -> Known_Element:
     """Checks if this international ID is a known element"""
-    for known_element in KNOWN_LIST:
-        # ISSN
-        if step == Steps.ISSN:
-            if known_element.issn == id:
-                return known_element
-            elif known_element.normalized_issn == normalize_intnat_id(id, Steps.ISSN):
-                return known_element
-            elif known_element.query == generate_intnat_id_sru_query(id, Steps.ISSN) and known_element.query != "":
-                return known_element
-        # ISBN
-        elif step == Steps.ISBN:
-            if known_element.isbn == id:
-                return known_element
-            elif known_element.normalized_isbn == normalize_intnat_id(id, Steps.ISBN):
-                return known_element
-            elif known_element.query == generate_intnat_id_sru_query(id, Steps.ISBN) and known_element.query != "":
-                return known_element
-        # Linked biblionumber
-        elif step == Steps.LINKED_BIBLIONUMBER:
-            if known_element.linked_biblionumber == id:
+    # ISSN & ISBN
+    if step in [Steps.ISSN, Steps.ISBN]:
+        for key in [id, normalize_intnat_id(id, step), generate_intnat_id_sru_query(id, step)]:
+            known_element = KNOWN_CACHE.get((step.name, key)) if key else None
+            if known_element:
                 return known_element
+    # Linked biblionumber
+    elif step == Steps.LINKED_BIBLIONUMBER:
+        return KNOWN_CACHE.get((step.name, id))
 
     return None
 
+def get_target_subfields(record:ET.Element) -> Tuple[Subfield]:
+    """Returns the 4XX subfields for this target record.
+    Subfields are generated only once per target biblionumber"""
+    bibnb_node = xmlb.get_controlfield(record, "001")
+    if bibnb_node is None or not bibnb_node.text:
+        return intern_subfields(generate_4XX_subfields(record))
+    subfields = KNOWN_CACHE.get(("TARGET", bibnb_node.text))
+    if subfields is None:
+        start = time.perf_counter()
+        subfields = intern_subfields(generate_4XX_subfields(record))
+        KNOWN_CACHE.set(("TARGET", bibnb_node.text), subfields)
+        trace = get_trace()
+        if trace is not None:
+            trace["generate_ms"] += (time.perf_counter() - start) * 1000
+    return subfields
+
 def get_manual_check_known_elements() -> List[Known_Element]:
     """Returns all knwonw elements using manual checks"""
     return MANUAL_CHECKS_KNOWN_LIST
 
-def manual_check_field(field:pymarc.field.Field) -> List[Subfield]:
+def manual_check_field(field:pymarc.field.Field) -> Tuple[Subfield]:
     """Checks if the field matches a manual check with link in subfields"""
     for known_element in get_manual_check_known_elements():
         if known_element.manual_check.check(field):
@@ -446,61 +589,144 @@ def manual_check_field(field:pymarc.field.Field) -> List[Subfield]:
                 return known_element.subfields
     return []
 
-def query_sru_step(step:Steps, id:str, record_index:str, record_id:str) -> List[Subfield]:
+def generate_step_query(id:str, step:Steps) -> str:
+    """Returns the SRU query for this ID & step, an empty string if there's none"""
+    if step == Steps.LINKED_BIBLIONUMBER:
+        return sru.generate_query([ksru.Part_Of_Query(ksru.SRU_Indexes.BIBLIONUMBER, ksru.SRU_Relations.EQUALS, id)])
+    elif step in [Steps.ISSN, Steps.ISBN]:
+        return generate_intnat_id_sru_query(id, step)
+    return ""
+
+def search_sru(query:str) -> ksru.SRU_Result_Search:
+    """Returns the SRU search result for this query.
+    Identical queries running at the same time share the same request"""
+    res, _ = SRU_SEARCHES.do(query, lambda: sru.search(
+        query,
+        record_schema=ksru.SRU_Record_Schemas.MARCXML,
+        start_record=1,
+        maximum_records=10
+    ))
+    return res
+
+def get_lookup_key(id:str, step:Steps, query:str) -> tuple:
+    """Returns the key identifying this ID lookup : IDs with the same normalised form are the same lookup"""
+    normalized_id = normalize_intnat_id(id, step)
+    return (step.name, normalized_id if normalized_id else query)
+
+def query_sru_step(step:Steps, id:str, record_index:str, record_id:str) -> Tuple[Subfield]:
     """For all parts querying SRU, checks the known elements and
     queries SRU if necessary.
-    Returns a list of subfields"""
+    Returns a tuple of subfields (shared, do not edit it)"""
     # Check if the id has a value
     if not id:
         return []
 
     # Checks if this ID is known for this step
     known_element = get_known_element_by_intnat_id(id, step)
+    trace = get_trace()
     if known_element:
+        if trace is not None:
+            trace["lookups"].append({"step":step.name, "id":id, "source":"cache", "provenance":known_element.provenance.value})
         return known_element.subfields
 
     # If this ID is not known, queries SRU
-    query = ""
-    if step == Steps.LINKED_BIBLIONUMBER:
-        query = sru.generate_query([ksru.Part_Of_Query(ksru.SRU_Indexes.BIBLIONUMBER, ksru.SRU_Relations.EQUALS, id)])
-    elif step in [Steps.ISSN, Steps.ISBN]:
-        query = generate_intnat_id_sru_query(id, step)
+    query = generate_step_query(id, step)
     # Return if query is empty
     if query == "":
         return []
-    
-    # Search SRU
-    res = sru.search(
-        query,
-        record_schema=ksru.SRU_Record_Schemas.MARCXML,
-        start_record=1,
-        maximum_records=10
-    )
-    # If there's an error, log & return an empty list
-    if (res.status == "Error"):
-        ERR_MAN.trigger_error(record_index, record_id, Errors.SRU_ERROR, f"Error occured during SRU request on {step.name}", res.get_error_msg())
+
+    # If another thread is looking up this ID, waits for its known element
+    subfields, shared = SRU_LOOKUPS.do(get_lookup_key(id, step, query), lambda: resolve_sru_step(step, id, query, record_index, record_id))
+    if shared:
+        if subfields is None:
+            # The SRU failed for the other thread, tries again like it would have done alone
+            subfields = resolve_sru_step(step, id, query, record_index, record_id)
+        elif trace is not None:
+            trace["lookups"].append({"step":step.name, "id":id, "source":"shared"})
+    if subfields is None:
         return []
+    return subfields
+
+def resolve_sru_step(step:Steps, id:str, query:str, record_index:str, record_id:str) -> Tuple[Subfield]:
+    """Queries SRU and adds the known element.
+    Returns a tuple of subfields (shared, do not edit it), None if the SRU failed"""
+    # Another thread could have resolved it since it was checked
+    known_element = get_known_element_by_intnat_id(id, step)
+    trace = get_trace()
+    if known_element:
+        if trace is not None:
+            trace["lookups"].append({"step":step.name, "id":id, "source":"cache"})
+        return known_element.subfields
+
+    # Search SRU, unless it was already done in the background
+    start = time.perf_counter()
+    res = None
+    prefetcher = getattr(JOB, "prefetcher", None)
+    if prefetcher:
+        used_before = prefetcher.used
+        res = prefetcher.get(query)
+    if res is None:
+        res = search_sru(query)
+    if trace is not None:
+        result = getattr(res, "result_as_string", None)
+        trace["lookups"].append({
+            "step":step.name,
+            "id":id,
+            "source":"sru",
+            "prefetched":prefetcher is not None and prefetcher.used > used_before,
+            "status":res.status,
+            "latency_ms":round((time.perf_counter() - start) * 1000, 3),
+            "response_size":len(result) if result is not None else None,
+            "nb_results":getattr(res, "nb_results", None)
+        })
+    # If there's an error, log & return None
+    if (res.status == "Error"):
+        JOB.sru_failed = True
+        get_err_man().trigger_error(record_index, record_id, Errors.SRU_ERROR, f"Error occured during SRU request on {step.name}", res.get_error_msg())
+        return None
     
     # Informative error, we use 1st record if the query is linked biblionumber
     if len(res.get_records_id()) > 1:
-        ERR_MAN.trigger_error(record_index, record_id, Errors.SRU_MULTIPLE_MATCHES, f"SRU returned multiple matches for this {step.name}", f"{step.name} {id} : {','.join(res.get_records_id())}")
+        get_err_man().trigger_error(record_index, record_id, Errors.SRU_MULTIPLE_MATCHES, f"SRU returned multiple matches for this {step.name}", f"{step.name} {id} : {','.join([bibnb or '' for bibnb in res.get_records_id()])}")
 
     # If there's a match, add known element
     subfields = []
     if len(res.get_records()) > 0: # Not == 1, we want to call it even with multiple matyched records
-        subfields = generate_4XX_subfields(res.get_records()[0])
+        subfields = get_target_subfields(res.get_records()[0])
     new_known_element = Known_Element(step, query, subfields, id)
     add_known_element(new_known_element)
+    # Multiple matches are not kept, so their error is raised by each run
+    if RESOLUTIONS is not None and len(res.get_records_id()) <= 1:
+        RESOLUTIONS.save(step.name, query, id, new_known_element.subfields)
+    # Other records returned by the SRU
+    add_cross_known_elements(res.get_records())
     return new_known_element.subfields
 
-# ---------- Preparing Main ----------
-MARC_READER = pymarc.MARCReader(open(RECORDS_FILE_PATH, 'rb'), to_unicode=True, force_utf8=True) # DON'T FORGET ME
-MARC_WRITER = open(FILE_OUT, "wb") # DON'T FORGET ME
-# ----- Load manual checks -----
-with open(MANUAL_CHECKS_FILE, mode="r+", encoding="utf-8") as f:
-    root = ET.fromstring(f.read())
-    for xml_check in root.findall("check"):
-        check = Manual_Check(xml_check)
+def add_cross_known_elements(records:List[ET.Element]):
+    """Adds known elements for the biblionumber of target records returned by the SRU.
+    Their ISSN & ISBN are not used : another record not returned yet could have them,
+    only a search on the ISSN / ISBN tells if it has multiple matches"""
+    for record in records:
+        record = xmlb.index_record(record)
+        bibnb_node = xmlb.get_controlfield(record, "001")
+        if bibnb_node is None or not bibnb_node.text:
+            continue
+        bibnb = bibnb_node.text
+        # A biblionumber only matches its record
+        if not get_known_element_by_intnat_id(bibnb, Steps.LINKED_BIBLIONUMBER):
+            add_known_element(Known_Element(Steps.LINKED_BIBLIONUMBER, generate_step_query(bibnb, Steps.LINKED_BIBLIONUMBER), get_target_subfields(record), bibnb, provenance=Provenances.CROSS_IDENTIFIER))
+
+# ---------- Main func def ----------
+
+def load_manual_checks() -> List[Manual_Check]:
+    """Returns all manual checks from the manual checks file"""
+    with open(MANUAL_CHECKS_FILE, mode="r+", encoding="utf-8") as f:
+        root = ET.fromstring(f.read())
+        return [Manual_Check(xml_check) for xml_check in root.findall("check")]
+
+def resolve_manual_checks(checks:List[Manual_Check]):
+    """Queries the SRU for each manual check and adds them to the known list"""
+    for check in checks:
         sru_request = [ksru.Part_Of_Query(ksru.SRU_Indexes.BIBLIONUMBER, ksru.SRU_Relations.EQUALS, check.bibnb)]
         query = sru.generate_query(sru_request)
         res = sru.search(
@@ -510,68 +736,518 @@ with open(MANUAL_CHECKS_FILE, mode="r+", encoding="utf-8") as f:
                     maximum_records=10
                 )
         if (res.status == "Error"):
-            ERR_MAN.trigger_error(-1, "Ø", Errors.MANUAL_CHECK_SRU, "Error occured during SRU request for a manual check", res.get_error_msg())
+            get_err_man().trigger_error(-1, "Ø", Errors.MANUAL_CHECK_SRU, "Error occured during SRU request for a manual check", res.get_error_msg())
             continue
         # Adds to the known list
         subfields = []
         if len(res.get_records()) > 0:
-            subfields = generate_4XX_subfields(res.get_records()[0])
+            subfields = get_target_subfields(res.get_records()[0])
         add_manual_check_known_element(Known_Element(Steps.MANUAL_CHECK, query, subfields, check))
+        add_cross_known_elements(res.get_records())
 
-# ---------- Main ----------
-# Loop through records
-for record_index, record in enumerate(MARC_READER):
-    # If record is invalid
-    if record is None:
-        ERR_MAN.trigger_error(record_index, "", Errors.CHUNK_ERROR, "", "")
-        continue # Fatal error, skipp
+def get_seed_subfields(field:pymarc.field.Field) -> Tuple[str, Tuple[Subfield]]:
+    """Returns a tuple (biblionumber, subfields) if this field was linked by this script, else None.
+    Linked fields start with a $9 & a $0 having the same value"""
+    if len(field.subfields) < 2:
+        return None
+    first, second = field.subfields[0], field.subfields[1]
+    if first.code != "9" or second.code != "0" or not first.value or first.value != second.value:
+        return None
+    return first.value, tuple(field.subfields)
+
+def seed_known_elements(paths:List[str], intnat_ids:bool=False):
+    """Adds known elements for the $9 of fields linked in previous output files, and for their $x & $y if intnat_ids is True.
+    Only fields without $v are used : with KEEP_V, a $v can come from the field instead of the target record,
+    while a linked field without $v always means the target record has none.
+    For each biblionumber, the most frequent subfields are used.
+    $x & $y found with multiple biblionumbers are skipped, but other catalogue records having them are not known,
+    so their multiple matches are not detected"""
+    variants:Dict[str, Dict[Tuple[Subfield], int]] = {}
+    nb_fields = 0
+    for path in paths:
+        reader = rio.get_reader(path)
+        for record in reader:
+            if record is None:
+                continue
+            for field in record.get_fields(*[str(nb) for nb in range(400, 500)]):
+                seed = get_seed_subfields(field)
+                if seed is None:
+                    continue
+                nb_fields += 1
+                bibnb, subfields = seed
+                counts = variants.setdefault(bibnb, {})
+                counts[subfields] = counts.get(subfields, 0) + 1
+        rio.close_reader(reader, path)
+
+    # Biblionumbers for each ISSN & ISBN, by normalised form
+    owners:Dict[Tuple[Steps, str], Dict[str, str]] = {}
+    seeds:Dict[str, Tuple[Subfield]] = {}
+    for bibnb, counts in variants.items():
+        for subfields in (counts if intnat_ids else []):
+            for step, code in [(Steps.ISSN, "x"), (Steps.ISBN, "y")]:
+                for subf in subfields:
+                    if subf.code == code and normalize_intnat_id(subf.value, step):
+                        owners.setdefault((step, normalize_intnat_id(subf.value, step)), {})[bibnb] = subf.value
+        counts = {subfields:count for subfields, count in counts.items() if "v" not in [subf.code for subf in subfields]}
+        if counts:
+            seeds[bibnb] = max(counts, key=counts.get)
+
+    known_elements:List[Known_Element] = []
+    for bibnb, subfields in seeds.items():
+        known_elements.append(Known_Element(Steps.LINKED_BIBLIONUMBER, generate_step_query(bibnb, Steps.LINKED_BIBLIONUMBER), subfields, bibnb, provenance=Provenances.SEED))
+    for (step, _), bibnbs in owners.items():
+        if len(bibnbs) > 1:
+            continue
+        bibnb, id = next(iter(bibnbs.items()))
+        query = generate_step_query(id, step)
+        if bibnb in seeds and query:
+            known_elements.append(Known_Element(step, query, seeds[bibnb], id, provenance=Provenances.SEED))
+
+    for known_element in known_elements:
+        add_known_element(known_element)
+    print(f"Seed : {len(known_elements)} known elements from {nb_fields} linked fields", file=sys.stderr)
 
-    # Gets the record ID
+def load_resolutions():
+    """Adds known elements for the resolutions of RESOLUTIONS_FILE.
+    If RESOLUTIONS_MAX_AGE is set, resolutions checked before are not used, so they are resolved again"""
+    checked_after = None
+    if RESOLUTIONS_MAX_AGE is not None:
+        checked_after = time.time() - RESOLUTIONS_MAX_AGE
+    resolutions = RESOLUTIONS.load(checked_after)
+    for resolution in resolutions:
+        subfields = [Subfield(code=code, value=value) for code, value in resolution.subfields]
+        add_known_element(Known_Element(Steps[resolution.step], resolution.query, subfields, resolution.id, provenance=Provenances.STORE))
+    print(f"Resolutions : {len(resolutions)} known elements loaded from {RESOLUTIONS_FILE}", file=sys.stderr)
+
+def get_record_id(record:pymarc.record.Record, record_index:int, trigger_errors:bool=True) -> str:
+    """Returns the record ID (001, else 035$a)"""
     record_id = record.get("001")
     if not record_id:
         # if no 001, check 035
         if not record.get("035"):
-            ERR_MAN.trigger_error(record_index, "", Errors.NO_RECORD_ID, "No 001 or 035", "")
+            if trigger_errors:
+                get_err_man().trigger_error(record_index, "", Errors.NO_RECORD_ID, "No 001 or 035", "")
         elif not record.get("035").get("a"):
-            ERR_MAN.trigger_error(record_index, "", Errors.NO_RECORD_ID, "No 001 or 035$a", "")
+            if trigger_errors:
+                get_err_man().trigger_error(record_index, "", Errors.NO_RECORD_ID, "No 001 or 035$a", "")
         else:
             record_id = record.get("035").get("a")
     else:
         record_id = record_id.data
+    return record_id
 
-    for field in record.get_fields(*U4XX_list): # *[] to iterate, using just [] returns nothing
-        # Priority : Manual Checks -> linked bibnb -> ISSN -> ISBN
-        for step in [Steps.MANUAL_CHECK, Steps.LINKED_BIBLIONUMBER, Steps.ISSN, Steps.ISBN]:
-            subfields = []
-            # Define whch value to use
-            value = None
-            if step == Steps.LINKED_BIBLIONUMBER:
-                value = field.get("9")
-            # ISSN : Get first $x and treats it like an ISSN
-            elif step == Steps.ISSN:
-                value = field.get("x")
-            # ISBN : Get first $y and treats it like an ISBN
-            elif step == Steps.ISBN:
-                value = field.get("y")
-            
-            if step == Steps.MANUAL_CHECK:
-                subfields = manual_check_field(field)
-            else:
-                # Check known values / query SRU
-                subfields = query_sru_step(step, value, record_index, record_id)
-            # If subfields were return, replace current field subfields and move to next field
-            # Otherwise, don't replace current 4XX and go to next test
-            if len(subfields) > 0:
-                # If subfields are getting replaced, check if there's $v + user wants to keep $v
-                if KEEP_V and "v" in field.subfields_as_dict():
-                    # If it's the case, remove new $v to keep old ones
-                    subfields = [subf for subf in subfields if subf.code != "v"] + [subf for subf in field.subfields if subf.code == "v"]
-                field.subfields = subfields
-                break
-
-    # Writes the record
-    MARC_WRITER.write(record.as_marc())
-
-MARC_READER.close()
-MARC_WRITER.close()
-ERR_MAN.close()
\ No newline at end of file
+def get_step_value(field:pymarc.field.Field, step:Steps) -> str:
+    """Returns the value used by this step for this field"""
+    if step == Steps.LINKED_BIBLIONUMBER:
+        return field.get("9")
+    # ISSN : Get first $x and treats it like an ISSN
+    elif step == Steps.ISSN:
+        return field.get("x")
+    # ISBN : Get first $y and treats it like an ISBN
+    elif step == Steps.ISBN:
+        return field.get("y")
+    return None
+
+def resolve_field(field:pymarc.field.Field, record_index:int, record_id:str) -> Tuple[Subfield]:
+    """Returns the subfields replacing the field ones (shared, do not edit it),
+    an empty tuple if the field is not changed"""
+    # Priority : Manual Checks -> linked bibnb -> ISSN -> ISBN
+    for step in STEPS_PRIORITY:
+        subfields = []
+        if step == Steps.MANUAL_CHECK:
+            subfields = manual_check_field(field)
+        else:
+            # Check known values / query SRU
+            subfields = query_sru_step(step, get_step_value(field, step), record_index, record_id)
+        # If subfields were return, replace current field subfields and move to next field
+        # Otherwise, don't replace current 4XX and go to next test
+        if len(subfields) > 0:
+            # If subfields are getting replaced, check if there's $v + user wants to keep $v
+            if KEEP_V and "v" in field.subfields_as_dict():
+                # If it's the case, remove new $v to keep old ones
+                subfields = [subf for subf in subfields if subf.code != "v"] + [subf for subf in field.subfields if subf.code == "v"]
+            trace = get_trace()
+            if trace is not None:
+                trace["step"] = step.name
+            return intern_subfields(subfields)
+    return ()
+
+def process_field(field:pymarc.field.Field, record_index:int, record_id:str):
+    """Replaces the field subfields with the first step returning subfields.
+    Identical fields are only resolved once"""
+    if TRACER:
+        start = time.perf_counter()
+        JOB.trace = {"record_index":record_index, "record_id":record_id, "tag":field.tag, "step":None,
+            "field_cache_hit":False, "lookups":[], "generate_ms":0.0}
+    key = ("FIELD", field.tag, tuple(field.subfields), KEEP_V)
+    subfields = KNOWN_CACHE.get(key)
+    if subfields is None:
+        JOB.sru_failed = False
+        subfields = resolve_field(field, record_index, record_id)
+        # SRU errors are not known elements, so the field must be resolved again next time
+        if not JOB.sru_failed:
+            KNOWN_CACHE.set(key, subfields)
+    elif TRACER:
+        JOB.trace["field_cache_hit"] = True
+    if len(subfields) > 0:
+        # Known elements subfields are shared, so give the field its own list
+        field.subfields = list(subfields)
+    if TRACER:
+        JOB.trace["generate_ms"] = round(JOB.trace["generate_ms"], 3)
+        JOB.trace["total_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        TRACER.write(JOB.trace)
+        JOB.trace = None
+
+def prepare():
+    """Opens the cache & the trace, loads the local export & the resolutions if needed & resolves the manual checks"""
+    global KNOWN_CACHE, TRACER, RESOLUTIONS
+    KNOWN_CACHE = Bounded_Cache(CACHE_MAX_MEMORY, CACHE_SPILL_FILE)
+    if TRACE_FILE:
+        TRACER = Trace_Writer(TRACE_FILE)
+    if LOCAL_EXPORT_FILE:
+        sru.load()
+    if PREFETCH_WINDOW > 0:
+        sru.set_pool_size(PREFETCH_WORKERS)
+    # Resolutions are checked more recently than previous outputs
+    if RESOLUTIONS_FILE:
+        RESOLUTIONS = Resolutions_Store(RESOLUTIONS_FILE)
+        load_resolutions()
+    if SEED_FILES:
+        seed_known_elements(SEED_FILES, SEED_INTNAT_IDS)
+    # ----- Load manual checks -----
+    resolve_manual_checks(load_manual_checks())
+
+def prefetch_record(record:pymarc.record.Record) -> List[str]:
+    """Starts the SRU queries this record will need for sure in the background.
+    For each field, only the first step that would query the SRU is prefetched,
+    so the SRU is not queried more than without prefetching.
+    Returns the prefetched queries"""
+    queries = []
+    if record is None:
+        return queries
+    for field in record.get_fields(*U4XX_list):
+        if ("FIELD", field.tag, tuple(field.subfields), KEEP_V) in KNOWN_CACHE or manual_check_field(field):
+            continue
+        query = get_prefetch_query([get_step_value(field, step) for step in SRU_STEPS])
+        if query:
+            JOB.prefetcher.submit(query)
+            queries.append(query)
+    return queries
+
+def get_prefetch_query(ids:List[str]) -> str:
+    """Returns the SRU query a field with these IDs (in SRU_STEPS order) will need for sure,
+    an empty string if there's none"""
+    for step, id in zip(SRU_STEPS, ids):
+        if not id:
+            continue
+        known_element = get_known_element_by_intnat_id(id, step)
+        if known_element:
+            # Same as query_sru_step() : next step is only used if there's no subfields
+            if len(known_element.subfields) > 0:
+                return ""
+            continue
+        query = generate_step_query(id, step)
+        if query != "":
+            # The result of this query decides if next steps are needed
+            return query
+    return ""
+
+def extract_identifier_columns(records_path:str, is_flagged:Callable[[pymarc.field.Field], bool]) -> Identifier_Columns:
+    """Reads all records from records_path and returns the IDs of their fields for each step,
+    with is_flagged() result for each field"""
+    columns = Identifier_Columns([step.name for step in SRU_STEPS])
+    # Keys are computed once per distinct value
+    keys_by_value:Dict[Tuple[Steps, str], str] = {}
+    reader = rio.get_reader(records_path)
+    for record_index, record in enumerate(reader):
+        if record is None:
+            columns.nb_invalid_records += 1
+            continue
+        columns.nb_records += 1
+        if not get_record_id(record, record_index, trigger_errors=False):
+            columns.nb_no_id_records += 1
+        for field in record.get_fields(*U4XX_list):
+            values = [get_step_value(field, step) or "" for step in SRU_STEPS]
+            keys = []
+            for step, value in zip(SRU_STEPS, values):
+                # Keys used to look for known elements (the query if nothing is left after normalisation)
+                if step != Steps.LINKED_BIBLIONUMBER and value:
+                    if (step, value) not in keys_by_value:
+                        query = generate_intnat_id_sru_query(value, step)
+                        keys_by_value[(step, value)] = normalize_intnat_id(value, step) or query if query != "" else ""
+                    value = keys_by_value[(step, value)]
+                keys.append(value)
+            columns.add_field(record_index, field.tag, is_flagged(field), values, keys)
+    rio.close_reader(reader, records_path)
+    return columns
+
+def plan_prefetch(records_path:str) -> List[Tuple[int, Tuple[str]]]:
+    """Returns the IDs of fields of records_path prefetch_record() would query the SRU for,
+    as tuples (index of the first record needing it, IDs in SRU_STEPS order), each IDs tuple once in records order.
+    The query is chosen with get_prefetch_query() when the record gets close, as IDs can be known by then"""
+    columns = extract_identifier_columns(records_path, lambda field: len(manual_check_field(field)) > 0)
+    plan = []
+    planned = set()
+    for record_index, _, manual_check, ids in columns.iter_fields():
+        ids = tuple(ids)
+        if manual_check or ids in planned or not get_prefetch_query(ids):
+            continue
+        planned.add(ids)
+        plan.append((record_index, ids))
+    return plan
+
+def process_records(reader:pymarc.Reader, writer:pymarc.Writer):
+    """Edits all records from the reader and writes them with the writer.
+    If PREFETCH_WINDOW is set, SRU queries of the next records are sent in the background,
+    following JOB.plan if it was planned for the whole file"""
+    records = enumerate(reader)
+    plan = getattr(JOB, "plan", None)
+    if PREFETCH_WINDOW > 0:
+        JOB.prefetcher = Prefetcher(search_sru, PREFETCH_WORKERS)
+        if plan is not None:
+            records = JOB.prefetcher.iter_plan(records, PREFETCH_WINDOW, plan, get_prefetch_query)
+        else:
+            records = JOB.prefetcher.iter_window(records, PREFETCH_WINDOW, lambda item: prefetch_record(item[1]))
+    try:
+        process_records_in_order(records, writer)
+    finally:
+        if PREFETCH_WINDOW > 0:
+            JOB.prefetcher.close()
+            JOB.prefetcher = None
+
+def process_records_in_order(records:Iterable[Tuple[int, pymarc.record.Record]], writer:pymarc.Writer):
+    """Edits all records with their index and writes them with the writer"""
+    # Loop through records
+    for record_index, record in records:
+        # If record is invalid
+        if record is None:
+            get_err_man().trigger_error(record_index, "", Errors.CHUNK_ERROR, "", "")
+            continue # Fatal error, skipp
+
+        # Gets the record ID
+        record_id = get_record_id(record, record_index)
+
+        for field in record.get_fields(*U4XX_list): # *[] to iterate, using just [] returns nothing
+            process_field(field, record_index, record_id)
+
+        # Writes the record
+        writer.write(record)
+
+def process_job(payload:bytes, output_format:str=None) -> Tuple[bytes, rio.Records_Formats, str, int]:
+    """Edits all records of the payload (ISO2709 or MARCXML) with the current caches.
+    Returns a tuple (edited records, their format, errors as CSV, number of records)"""
+    errors_file = io.StringIO()
+    records_file = io.BytesIO()
+    # Cleared even if the payload or the format are invalid, so the next job on this thread starts clean
+    try:
+        JOB.err_man = Errors_Manager(None, aggregate=AGGREGATE_ERRORS, file=errors_file)
+        reader = rio.get_stream_reader(io.BufferedReader(io.BytesIO(payload)))
+        records_format = rio.guess_output_format(rio.STDIO_PATH, output_format, rio.get_reader_format(reader))
+        writer = rio.get_stream_writer(records_file, records_format)
+        process_records(reader, writer)
+        writer.close(close_fh=False)
+        JOB.err_man.close()
+    finally:
+        JOB.err_man = None
+    return records_file.getvalue(), records_format, errors_file.getvalue(), writer.nb_written
+
+def process_file(records_path:str, file_out:str, err_man:Errors_Manager) -> int:
+    """Edits all records from records_path and writes them in file_out, errors go to err_man.
+    Returns the number of written records"""
+    JOB.err_man = err_man
+    try:
+        # The whole file is read once to plan the queries, records are not kept
+        if PREFETCH_WINDOW > 0 and PREFETCH_PLAN and not rio.is_stdio(records_path):
+            JOB.plan = plan_prefetch(records_path)
+        reader = rio.get_reader(records_path)
+        writer = rio.get_writer(file_out, rio.guess_output_format(file_out, OUTPUT_FORMAT, rio.get_reader_format(reader)))
+        process_records(reader, writer)
+        rio.close_reader(reader, records_path)
+        rio.close_writer(writer, file_out)
+    finally:
+        JOB.err_man = None
+        JOB.plan = None
+    return writer.nb_written
+
+def finish():
+    """Writes the cache stats in stderr if the cache is bounded & the SRU endpoints stats if there are several,
+    then closes the cache, the trace & the resolutions"""
+    if CACHE_MAX_MEMORY is not None:
+        print(f"Cache : {KNOWN_CACHE.stats_as_string()}", file=sys.stderr)
+    if isinstance(sru, ksru_pool.Koha_SRU_Pool):
+        print(f"SRU endpoints :\n{sru.stats_as_string()}", file=sys.stderr)
+    KNOWN_CACHE.close()
+    if TRACER:
+        TRACER.close()
+    if RESOLUTIONS is not None:
+        RESOLUTIONS.close()
+
+def main():
+    """Edits all records from RECORDS_FILE and writes them in FILE_OUT"""
+    global ERR_MAN
+    # ---------- Preparing Main ----------
+    ERR_MAN = Errors_Manager(ERRORS_FILE_PATH, aggregate=AGGREGATE_ERRORS)
+    # Aggregated errors are only written when the errors manager is closed
+    try:
+        prepare()
+
+        # ---------- Main ----------
+        process_file(RECORDS_FILE_PATH, FILE_OUT, ERR_MAN)
+    finally:
+        ERR_MAN.close()
+        finish()
+
+def batch_file(records_path:str) -> Tuple[str, int, float]:
+    """Processes one file of the batch, writing its records & its errors in BATCH_OUTPUT_DIR.
+    Returns a tuple (file path, number of records, duration in seconds)"""
+    start = time.perf_counter()
+    file_out, errors_path = rio.get_batch_output_paths(records_path, BATCH_OUTPUT_DIR)
+    err_man = Errors_Manager(errors_path, aggregate=AGGREGATE_ERRORS)
+    try:
+        nb_records = process_file(records_path, file_out, err_man)
+    finally:
+        err_man.close()
+    return records_path, nb_records, time.perf_counter() - start
+
+def batch():
+    """Edits all files matching BATCH_INPUT with the same caches & SRU connection,
+    BATCH_WORKERS files at once"""
+    global ERR_MAN
+    files = rio.list_batch_inputs(BATCH_INPUT, BATCH_OUTPUT_DIR)
+    os.makedirs(BATCH_OUTPUT_DIR, exist_ok=True)
+    # Errors happening while preparing go to ERRORS_FILE
+    ERR_MAN = Errors_Manager(ERRORS_FILE_PATH, aggregate=AGGREGATE_ERRORS)
+    try:
+        prepare()
+        sru.set_pool_size(BATCH_WORKERS * max(1, PREFETCH_WORKERS if PREFETCH_WINDOW > 0 else 1))
+        executor = ThreadPoolExecutor(max_workers=max(1, BATCH_WORKERS))
+        try:
+            for records_path, nb_records, duration in executor.map(batch_file, files):
+                print(f"{records_path} : {nb_records} records in {duration:.3f} s", file=sys.stderr)
+        finally:
+            # If it stops early, files being processed are finished & the others are skipped
+            executor.shutdown(cancel_futures=True)
+    finally:
+        ERR_MAN.close()
+        finish()
+
+def serve():
+    """Starts the local service, keeping the caches & the manual checks between jobs"""
+    global ERR_MAN
+    # Errors happening while preparing go to ERRORS_FILE
+    ERR_MAN = Errors_Manager(ERRORS_FILE_PATH, aggregate=AGGREGATE_ERRORS)
+    try:
+        prepare()
+        local_service.serve(SERVICE_HOST, SERVICE_PORT, process_job, KNOWN_CACHE.stats_as_string,
+            sru_stats=sru.stats if isinstance(sru, ksru_pool.Koha_SRU_Pool) else None)
+    finally:
+        ERR_MAN.close()
+        finish()
+
+def dry_run():
+    """Estimates the workload of RECORDS_FILE without querying the SRU or writing any record"""
+    start = time.perf_counter()
+    checks = load_manual_checks()
+    columns = extract_identifier_columns(RECORDS_FILE_PATH, lambda field: any(check.check(field) for check in checks))
+    unique_values = {step:columns.count_unique(step.name, keys=False) for step in SRU_STEPS}
+    unique_keys = {step:columns.rank(step.name) for step in SRU_STEPS}
+
+    # Worst case : every manual check & every distinct ID is queried
+    nb_sru_calls = len(checks) + sum([len(keys) for keys in unique_keys.values()])
+    print(f"Records : {columns.nb_records + columns.nb_invalid_records} ({columns.nb_invalid_records} invalid, {columns.nb_no_id_records} without ID)")
+    print(f"4XX fields : {len(columns)}")
+    print(f"Fields matching a manual check : {columns.nb_flagged()} ({len(checks)} manual checks)")
+    for step in SRU_STEPS:
+        print(f"Unique {step.name} : {len(unique_values[step])} ({len(unique_keys[step])} after normalisation)")
+    for step in SRU_STEPS:
+        if unique_keys[step]:
+            print(f"Most frequent {step.name} : " + ", ".join([f"{key} ({count})" for key, count, _ in unique_keys[step][:DRY_RUN_TOP]]))
+    print(f"Worst-case SRU calls : {nb_sru_calls}")
+    print(f"Estimated runtime : {nb_sru_calls * SRU_LATENCY:.0f} s (SRU latency : {SRU_LATENCY} s)")
+    print(f"Identifier columns : {columns.nbytes() / 1024 / 1024:.1f} MB for {len(columns.strings)} distinct strings")
+    print(f"Planning duration : {time.perf_counter() - start:.2f} s")
+
+def is_refresh_hour() -> bool:
+    """Returns if the refresh can run now (always if REFRESH_HOURS is not set)"""
+    if REFRESH_HOURS is None:
+        return True
+    start, end = REFRESH_HOURS
+    hour = time.localtime().tm_hour
+    if start <= end:
+        return start <= hour < end
+    # Over midnight
+    return hour >= start or hour < end
+
+def refresh_resolution(resolution:Resolution) -> Change_Status:
+    """Queries the SRU again for this resolution & updates it.
+    Returns the change status, None if it did not change"""
+    res = search_sru(resolution.query)
+    if res.status == "Error":
+        RESOLUTIONS.record_error(resolution, res.get_error_msg())
+        return Change_Status.ERROR
+    if len(res.get_records_id()) > 1:
+        RESOLUTIONS.remove(resolution, ",".join([bibnb or "" for bibnb in res.get_records_id()]))
+        return Change_Status.REMOVED
+    subfields = []
+    if len(res.get_records()) > 0:
+        # Target subfields are not cached, so memory does not grow with the number of resolutions
+        subfields = generate_4XX_subfields(res.get_records()[0])
+    if RESOLUTIONS.refresh(resolution, subfields):
+        return Change_Status.CHANGED
+    return None
+
+def refresh():
+    """Queries the SRU again for the least recently checked resolutions of RESOLUTIONS_FILE,
+    REFRESH_BATCH_SIZE at once with a pause between batches, during REFRESH_HOURS"""
+    global RESOLUTIONS
+    if not RESOLUTIONS_FILE:
+        raise ValueError("REFRESH_RESOLUTIONS needs RESOLUTIONS_FILE to be set")
+    RESOLUTIONS = Resolutions_Store(RESOLUTIONS_FILE)
+    sru.set_pool_size(REFRESH_WORKERS)
+    if not is_refresh_hour():
+        print(f"Refresh : waiting for {REFRESH_HOURS[0]}h", file=sys.stderr)
+        while not is_refresh_hour():
+            time.sleep(60)
+    start = time.time()
+    counts = {status:0 for status in Change_Status}
+    nb_checked = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, REFRESH_WORKERS)) as executor:
+            while is_refresh_hour():
+                limit = REFRESH_BATCH_SIZE
+                if REFRESH_MAX_ENTRIES is not None:
+                    limit = min(limit, REFRESH_MAX_ENTRIES - nb_checked)
+                if limit <= 0:
+                    break
+                # Checked resolutions are now more recent than start, failed ones are still first
+                batch = RESOLUTIONS.get_stalest(limit, min(start, time.time() - REFRESH_MIN_AGE), offset=counts[Change_Status.ERROR])
+                if not batch:
+                    break
+                statuses = list(executor.map(refresh_resolution, batch))
+                nb_checked += len(batch)
+                for status in statuses:
+                    if status is not None:
+                        counts[status] += 1
+                if statuses.count(Change_Status.ERROR) == len(batch):
+                    print("Refresh : stopped, all requests of the batch failed", file=sys.stderr)
+                    break
+                time.sleep(REFRESH_PAUSE)
+    finally:
+        print(f"Refresh : {nb_checked} resolutions checked in {time.time() - start:.1f} s, "\
+            + ", ".join([f"{count} {status.value}" for status, count in counts.items()]), file=sys.stderr)
+        finish()
+
+# Processes used to load a local export re-import this file, so nothing must run on import
+if __name__ == "__main__":
+    # Being killed runs the finally blocks, so errors files are closed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    if DRY_RUN:
+        dry_run()
+    elif REFRESH_RESOLUTIONS:
+        refresh()
+    elif SERVICE_PORT:
+        serve()
+    elif BATCH_INPUT:
+        batch()
+    else:
+        main()
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+
+# Splits a records file in partitions to process them on separate machines,
+# then merges their output files & errors files back in the original order
+#   - split : writes the partitions, a manifest & a snapshot of the manual checks file
+#   - merge : checks no record was lost or duplicated, then writes FILE_OUT & the errors file
+# with record indexes of the original file
+# Usage :
+#   python partitions.py split RECORDS_FILE OUTPUT_DIR --parts N [--manual-checks MANUAL_CHECKS_FILE]
+#   python partitions.py merge MANIFEST FILE_OUT ERRORS_FILE [--outputs-dir DIR]
+
+# See README.md for more informations
+
+# external imports
+import argparse
+import csv
+import hashlib
+import json
+import os
+import shutil
+from typing import BinaryIO, Dict, Iterable, List, Tuple
+import xml.etree.ElementTree as ET
+import pymarc
+
+# Internal import
+import records_io as rio
+import compressed_io as cio
+from errors_manager import Errors_Manager, Errors, Error_File_Headers
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+MARC_NS = "http://www.loc.gov/MARC21/slim"
+# Errors raised only the first time an ID is resolved, so once per execution
+RESOLUTION_ERRORS = [Errors.SRU_MULTIPLE_MATCHES.name]
+
+# --------------- Records ---------------
+
+def iter_iso2709_chunks(file_handle:BinaryIO) -> Iterable[bytes]:
+    """Yields raw records, cut like pymarc.MARCReader does (using the record length).
+    After an invalid length, a truncated record or a missing end of record,
+    the rest of the file is yielded as is, as the reader stops there"""
+    while True:
+        first5 = file_handle.read(5)
+        if not first5:
+            return
+        try:
+            length = int(first5)
+        except ValueError:
+            yield first5 + file_handle.read()
+            return
+        chunk = first5 + file_handle.read(max(length - 5, 0))
+        if len(chunk) < length or chunk[-1:] != pymarc.END_OF_RECORD.encode():
+            yield chunk + file_handle.read()
+            return
+        yield chunk
+
+def iter_marcxml_chunks(file_handle:BinaryIO) -> Iterable[bytes]:
+    """Yields MARCXML record nodes as bytes"""
+    ET.register_namespace("", MARC_NS)
+    root = None
+    for event, node in ET.iterparse(file_handle, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = node
+            continue
+        if rio.local_name(node.tag) != "record":
+            continue
+        yield ET.tostring(node, encoding="utf-8", xml_declaration=False)
+        node.clear()
+        if root is not node:
+            root.clear()
+
+def iter_chunks(path:str, records_format:rio.Records_Formats) -> Iterable[bytes]:
+    """Yields raw records of the file (decompressed if needed)"""
+    with cio.open_input(path) as f:
+        if records_format == rio.Records_Formats.MARCXML:
+            yield from iter_marcxml_chunks(f)
+        else:
+            yield from iter_iso2709_chunks(f)
+
+def parse_chunk(chunk:bytes, records_format:rio.Records_Formats) -> pymarc.Record:
+    """Returns the raw record as a pymarc record, None if it can't be read"""
+    if records_format == rio.Records_Formats.MARCXML:
+        return rio.xml_to_record(ET.fromstring(chunk))
+    try:
+        # Rest of the file after a record the reader stops at
+        if int(chunk[:5]) != len(chunk) or chunk[-1:] != pymarc.END_OF_RECORD.encode():
+            return None
+        return pymarc.Record(chunk, to_unicode=True, force_utf8=True)
+    except Exception:
+        return None
+
+def get_record_id(record:pymarc.Record) -> str:
+    """Returns the record ID (001, else 035$a, else an empty string)"""
+    if record.get("001"):
+        return record.get("001").data
+    if record.get("035") and record.get("035").get("a"):
+        return record.get("035").get("a")
+    return ""
+
+def hash_ids(ids:List[str]) -> str:
+    """Returns the SHA-256 of the records IDs, in order"""
+    return hashlib.sha256("\n".join(ids).encode("utf-8")).hexdigest()
+
+def hash_file(path:str) -> str:
+    """Returns the SHA-256 of the file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024*1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def guess_file_format(path:str) -> rio.Records_Formats:
+    """Returns the format of the records file"""
+    with cio.make_peekable(cio.open_input(path), rio.FORMAT_PEEK_SIZE) as f:
+        return rio.guess_input_format(f)
+
+# --------------- Split ---------------
+
+def split(records_path:str, output_dir:str, nb_parts:int, manual_checks_path:str=None) -> dict:
+    """Splits the records file in nb_parts partitions of consecutive records in output_dir,
+    with a manifest & a snapshot of the manual checks file.
+    Returns the manifest"""
+    records_format = guess_file_format(records_path)
+    extension = ".xml" if records_format == rio.Records_Formats.MARCXML else ".mrc"
+    nb_records = sum(1 for _ in iter_chunks(records_path, records_format))
+    nb_parts = max(1, min(nb_parts, nb_records))
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = {
+        "version":MANIFEST_VERSION,
+        "source":os.path.abspath(records_path),
+        "source_sha256":hash_file(records_path),
+        "format":records_format.value,
+        "nb_records":nb_records,
+        "manual_checks_file":None,
+        "manual_checks_sha256":None,
+        "partitions":[]
+    }
+    if manual_checks_path:
+        manifest["manual_checks_file"] = os.path.basename(manual_checks_path)
+        shutil.copyfile(manual_checks_path, os.path.join(output_dir, manifest["manual_checks_file"]))
+        manifest["manual_checks_sha256"] = hash_file(manual_checks_path)
+
+    chunks = iter_chunks(records_path, records_format)
+    first_record_index = 0
+    offset = 0
+    for part_index in range(nb_parts):
+        # Spreads the remainder on the first partitions
+        part_nb_records = nb_records // nb_parts + (1 if part_index < nb_records % nb_parts else 0)
+        name = f"part_{part_index:04d}"
+        partition = {
+            "index":part_index,
+            "records_file":name + extension,
+            "output_file":f"{name}_out{extension}",
+            "errors_file":f"{name}_errors.csv",
+            "first_record_index":first_record_index,
+            "nb_records":part_nb_records,
+            # Offset & size in the source file, decompressed (ISO2709 only)
+            "offset":offset if records_format == rio.Records_Formats.ISO2709 else None,
+            "size":0,
+            "unreadable_records":0,
+            "ids_sha256":None
+        }
+        ids = []
+        with open(os.path.join(output_dir, partition["records_file"]), "wb") as f:
+            if records_format == rio.Records_Formats.MARCXML:
+                f.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<collection xmlns="{MARC_NS}">'.encode("utf-8"))
+            for _ in range(part_nb_records):
+                chunk = next(chunks)
+                f.write(chunk)
+                partition["size"] += len(chunk)
+                record = parse_chunk(chunk, records_format)
+                if record is None:
+                    partition["unreadable_records"] += 1
+                else:
+                    ids.append(get_record_id(record))
+            if records_format == rio.Records_Formats.MARCXML:
+                f.write(b"</collection>\n")
+        partition["ids_sha256"] = hash_ids(ids)
+        manifest["partitions"].append(partition)
+        first_record_index += part_nb_records
+        offset += partition["size"]
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4, ensure_ascii=False)
+    return manifest
+
+# --------------- Merge ---------------
+
+def check_partition_output(partition:dict, output_path:str, errors_rows:List[Dict[str, str]]):
+    """Raises a ValueError if records of the partition output are missing, duplicated or out of order.
+    Unreadable records are not written, but raise a CHUNK_ERROR"""
+    records_format = guess_file_format(output_path)
+    ids = []
+    for chunk in iter_chunks(output_path, records_format):
+        record = parse_chunk(chunk, records_format)
+        if record is None:
+            raise ValueError(f"{output_path} : unreadable record n°{len(ids) + 1}")
+        ids.append(get_record_id(record))
+    expected = partition["nb_records"] - partition["unreadable_records"]
+    if len(ids) != expected:
+        raise ValueError(f"{output_path} : {len(ids)} records instead of {expected}")
+    if hash_ids(ids) != partition["ids_sha256"]:
+        raise ValueError(f"{output_path} : records do not match the partition (missing, duplicated or out of order)")
+    nb_chunk_errors = len([row for row in errors_rows if row[Error_File_Headers.ERROR.value] == Errors.CHUNK_ERROR.name])
+    if nb_chunk_errors != partition["unreadable_records"]:
+        raise ValueError(f"Partition {partition['index']} : {nb_chunk_errors} CHUNK_ERROR instead of {partition['unreadable_records']}")
+
+def read_errors(errors_path:str) -> List[Dict[str, str]]:
+    """Returns the rows of a partition errors file"""
+    with cio.open_text_input(errors_path) as f:
+        reader = csv.DictReader(f, delimiter=";")
+        if reader.fieldnames != [member.value for member in Error_File_Headers]:
+            raise ValueError(f"{errors_path} : unexpected headers, errors must not be aggregated to be merged")
+        return list(reader)
+
+def write_records(output_paths:List[str], file_out:str, output_format:str=None):
+    """Writes records of all output files in file_out, in order"""
+    formats = [guess_file_format(path) for path in output_paths]
+    records_format = rio.guess_output_format(file_out, output_format, formats[0] if formats else None)
+    # Same format everywhere : raw records are copied as is
+    if records_format == rio.Records_Formats.ISO2709 and all([fmt == records_format for fmt in formats]):
+        f = rio.open_output(file_out)
+        for path in output_paths:
+            for chunk in iter_chunks(path, records_format):
+                f.write(chunk)
+        if rio.is_stdio(file_out):
+            f.flush()
+        else:
+            f.close()
+        return
+    writer = rio.get_writer(file_out, records_format)
+    for path in output_paths:
+        reader = rio.get_reader(path)
+        for record in reader:
+            writer.write(record)
+        rio.close_reader(reader, path)
+    rio.close_writer(writer, file_out)
+
+def merge(manifest_path:str, file_out:str, errors_path:str, outputs_dir:str=None, output_format:str=None) -> dict:
+    """Checks the partitions outputs, then writes their records in file_out & their errors in errors_path,
+    with record indexes of the original file.
+    Errors raised once per execution (manual checks, multiple matches) are only kept the first time.
+    Returns the manifest"""
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if outputs_dir is None:
+        outputs_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+    # Partitions must cover all records once
+    first_record_index = 0
+    for partition in sorted(manifest["partitions"], key=lambda partition: partition["index"]):
+        if partition["first_record_index"] != first_record_index:
+            raise ValueError(f"Partition {partition['index']} starts at record {partition['first_record_index']} instead of {first_record_index}")
+        first_record_index += partition["nb_records"]
+    if first_record_index != manifest["nb_records"]:
+        raise ValueError(f"Partitions have {first_record_index} records instead of {manifest['nb_records']}")
+
+    output_paths = []
+    errors:List[Tuple[int, Dict[str, str]]] = []
+    for partition in sorted(manifest["partitions"], key=lambda partition: partition["index"]):
+        output_path = os.path.join(outputs_dir, partition["output_file"])
+        rows = read_errors(os.path.join(outputs_dir, partition["errors_file"]))
+        check_partition_output(partition, output_path, rows)
+        output_paths.append(output_path)
+        for row in rows:
+            # Errors not linked to a record (manual checks) have no index
+            index = row[Error_File_Headers.INDEX.value]
+            index = int(index) + partition["first_record_index"] if index.isdigit() else -1
+            errors.append((index, row))
+
+    write_records(output_paths, file_out, output_format)
+
+    # Manual checks errors first, like in a single execution
+    err_man = Errors_Manager(errors_path)
+    seen = set()
+    for index, row in sorted(errors, key=lambda error: error[0] >= 0):
+        error = row[Error_File_Headers.ERROR.value]
+        key = (error, row[Error_File_Headers.TXT.value], row[Error_File_Headers.DATA.value])
+        if index < 0 or error in RESOLUTION_ERRORS:
+            if key in seen:
+                continue
+            seen.add(key)
+        err_man.trigger_error(index, row[Error_File_Headers.ID.value], Errors[error], row[Error_File_Headers.TXT.value], row[Error_File_Headers.DATA.value])
+    err_man.close()
+    return manifest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Splits a records file in partitions & merges their outputs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    split_parser = subparsers.add_parser("split", help="splits a records file in partitions")
+    split_parser.add_argument("records_file", help="ISO2709 or MARCXML file (not stdin)")
+    split_parser.add_argument("output_dir", help="directory where partitions & the manifest are written (will be created)")
+    split_parser.add_argument("--parts", type=int, required=True, help="number of partitions")
+    split_parser.add_argument("--manual-checks", help="manual checks file to snapshot with the partitions")
+    merge_parser = subparsers.add_parser("merge", help="merges the outputs of partitions")
+    merge_parser.add_argument("manifest", help="manifest written by split")
+    merge_parser.add_argument("file_out", help="merged records file, - for stdout")
+    merge_parser.add_argument("errors_file", help="merged errors file")
+    merge_parser.add_argument("--outputs-dir", help="directory with the partitions output & errors files (defaults to the manifest directory)")
+    merge_parser.add_argument("--output-format", choices=[e.value for e in rio.Records_Formats], help="format of the merged records, like OUTPUT_FORMAT")
+    args = parser.parse_args()
+
+    if args.command == "split":
+        manifest = split(args.records_file, args.output_dir, args.parts, args.manual_checks)
+        print(f"{manifest['nb_records']} records split in {len(manifest['partitions'])} partitions in {args.output_dir}")
+    else:
+        manifest = merge(args.manifest, args.file_out, args.errors_file, args.outputs_dir, args.output_format)
+        if not rio.is_stdio(args.file_out):
+            print(f"{manifest['nb_records']} records of {len(manifest['partitions'])} partitions merged in {args.file_out}")
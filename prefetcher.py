@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+class Prefetcher(object):
+    """Prefetcher
+    =======
+    Runs searches in background threads before they are needed.
+    Results are kept until every record which asked for them released them.
+    On init take as arguments :
+        - search {Callable} : function taking a query and returning its result
+        - [optional] workers {int} : number of searches running at once"""
+    def __init__(self, search:Callable[[str], Any], workers:int=8) -> None:
+        self.search = search
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="Prefetcher")
+        # query → [future, number of records waiting for it]
+        self.futures:Dict[str, list] = {}
+        self.lock = threading.Lock()
+        # Stats
+        self.submitted = 0
+        self.used = 0
+
+    def submit(self, query:str):
+        """Starts the search for this query if it is not already running"""
+        with self.lock:
+            if query in self.futures:
+                self.futures[query][1] += 1
+                return
+            self.futures[query] = [self.executor.submit(self.search, query), 1]
+            self.submitted += 1
+
+    def get(self, query:str) -> Any:
+        """Waits for the prefetched result of this query, None if it was not prefetched"""
+        with self.lock:
+            entry = self.futures.get(query)
+        if entry is None:
+            return None
+        future:Future = entry[0]
+        self.used += 1
+        return future.result()
+
+    def release(self, query:str):
+        """Forgets the result once no record in the window needs it anymore"""
+        with self.lock:
+            entry = self.futures.get(query)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self.futures[query]
+
+    def iter_window(self, items:Iterable, size:int, prefetch:Callable[[Any], List[str]]) -> Iterable[Any]:
+        """Yields items in order, keeping up to size items ahead whose queries are being prefetched.
+        prefetch is called on each item when it enters the window and returns the submitted queries"""
+        window:deque[Tuple[Any, List[str]]] = deque()
+        try:
+            for item in items:
+                window.append((item, prefetch(item)))
+                if len(window) > size:
+                    yield from self.__pop(window)
+            while window:
+                yield from self.__pop(window)
+        finally:
+            # Releases queries of items left if the loop was interrupted
+            for _, queries in window:
+                for query in queries:
+                    self.release(query)
+
+    def iter_plan(self, items:Iterable, size:int, plan:List[Tuple[int, Any]], get_query:Callable[[Any], str]) -> Iterable[Any]:
+        """Yields items in order, keeping the queries needed by the next size items submitted.
+        plan lists tuples (position of the first item needing it, entry) sorted by position,
+        get_query is called on each entry when it is submitted and returns its query (empty string for none).
+        Queries are released once this item was processed"""
+        submitted:deque[Tuple[int, str]] = deque()
+        next_entry = 0
+        try:
+            for position, item in enumerate(items):
+                while next_entry < len(plan) and plan[next_entry][0] < position + size:
+                    query = get_query(plan[next_entry][1])
+                    if query:
+                        self.submit(query)
+                        submitted.append((plan[next_entry][0], query))
+                    next_entry += 1
+                yield item
+                while submitted and submitted[0][0] <= position:
+                    self.release(submitted.popleft()[1])
+        finally:
+            # Releases queries submitted but not used if the loop was interrupted
+            for _, query in submitted:
+                self.release(query)
+
+    def __pop(self, window:deque) -> Iterable[Any]:
+        """Yields the oldest item of the window, then releases its queries"""
+        item, queries = window.popleft()
+        try:
+            yield item
+        finally:
+            for query in queries:
+                self.release(query)
+
+    def close(self):
+        """Stops the background threads, pending searches are cancelled"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
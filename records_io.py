@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+from enum import Enum
+import glob
+import os
+import sys
+from typing import BinaryIO, List, Tuple
+import xml.etree.ElementTree as ET
+import pymarc
+from pymarc import Subfield
+
+# Internal import
+import compressed_io as cio
+
+# Path meaning stdin for RECORDS_FILE & stdout for FILE_OUT
+STDIO_PATH = "-"
+
+class Records_Formats(Enum):
+    ISO2709 = "iso2709"
+    MARCXML = "marcxml"
+
+# Number of bytes read to guess the input format
+FORMAT_PEEK_SIZE = 64
+
+# Extensions used to choose the output format
+FORMATS_EXTENSIONS = {
+    ".xml":Records_Formats.MARCXML,
+    ".mrc":Records_Formats.ISO2709,
+    ".marc":Records_Formats.ISO2709,
+    ".iso":Records_Formats.ISO2709,
+    ".iso2709":Records_Formats.ISO2709
+}
+
+# Tags of the fields which can be edited, only them are encoded again when writing ISO2709
+# Not set : records are fully encoded again (pymarc as_marc())
+PATCH_TAGS:frozenset = None
+
+def set_patch_tags(tags:List[str]):
+    """Chooses the tags of the fields which can be edited : ISO2709 records read afterwards keep their original bytes,
+    and are written by patching only those fields if they changed. None to always encode records again"""
+    global PATCH_TAGS
+    PATCH_TAGS = frozenset(tags) if tags is not None else None
+
+# ---------- ISO2709 patching ----------
+
+def get_field_state(field:pymarc.Field) -> tuple:
+    """Returns what writing the field depends on, to know if it was edited"""
+    if field.is_control_field():
+        return (field.tag, field.data)
+    return (field.tag, tuple(field.indicators), tuple(field.subfields))
+
+class Patchable_Record(pymarc.Record):
+    """Patchable_Record
+    =======
+    pymarc.Record keeping its original bytes (marc_chunk)
+    and the state of its fields with a tag in PATCH_TAGS (marc_states)"""
+    __slots__ = ("marc_chunk", "marc_states")
+
+class MARCReader(pymarc.MARCReader):
+    """MARCReader
+    =======
+    pymarc.MARCReader returning Patchable_Record if PATCH_TAGS is set"""
+    def __next__(self) -> pymarc.Record:
+        record = super().__next__()
+        if record is None or PATCH_TAGS is None:
+            return record
+        patchable = Patchable_Record(to_unicode=record.to_unicode, force_utf8=record.force_utf8)
+        patchable.leader = record.leader
+        patchable.fields = record.fields
+        patchable.marc_chunk = self._current_chunk
+        patchable.marc_states = [(position, get_field_state(field)) for position, field in enumerate(record.fields) if field.tag in PATCH_TAGS]
+        return patchable
+
+def patch_marc(record:Patchable_Record) -> bytes:
+    """Returns the record in ISO2709 like record.as_marc(), but built from its original bytes :
+    only fields whose state changed are encoded again, unchanged fields bytes are copied as is,
+    the directory entries from the first changed field & the leader are recomputed.
+    Returns None if the record can't be patched (fields were added or removed, fields data is not in directory order)"""
+    chunk:bytes = record.marc_chunk
+    base_address = int(chunk[12:17])
+    directory = chunk[pymarc.record.LEADER_LEN:base_address - 1]
+    entry_len = pymarc.record.DIRECTORY_ENTRY_LEN
+    nb_fields = len(directory) // entry_len
+    if nb_fields != len(record.fields):
+        return None
+    # as_marc() writes fields data one after the other, in directory order
+    lengths = []
+    offsets = []
+    offset = 0
+    for start in range(0, nb_fields * entry_len, entry_len):
+        if int(directory[start + 7:start + 12]) != offset:
+            return None
+        offsets.append(offset)
+        lengths.append(int(directory[start + 3:start + 7]))
+        offset += lengths[-1]
+    if base_address + offset + 1 != len(chunk):
+        return None
+
+    # Same as as_marc() : data is UTF-8
+    record.leader.coding_scheme = "a"
+    data = chunk[base_address:]
+    changed = [position for position, state in record.marc_states if get_field_state(record.fields[position]) != state]
+    if changed:
+        # Unchanged data between changed fields is copied as is
+        pieces = []
+        data_start = 0
+        for position in changed:
+            field_data = record.fields[position].as_marc(encoding="utf-8")
+            pieces += [data[data_start:offsets[position]], field_data]
+            data_start = offsets[position] + lengths[position]
+            lengths[position] = len(field_data)
+        pieces.append(data[data_start:])
+        data = b"".join(pieces)
+        # Entries before the first changed field are the same
+        entries = [directory[:changed[0] * entry_len]]
+        offset = offsets[changed[0]]
+        for position in range(changed[0], nb_fields):
+            tag = record.fields[position].tag
+            tag = ("%03d" % int(tag)) if tag.isdigit() else ("%03s" % tag)
+            entries.append(f"{tag}{lengths[position]:0>4}{offset:0>5}".encode("utf-8"))
+            offset += lengths[position]
+        directory = b"".join(entries)
+    base_address = pymarc.record.LEADER_LEN + len(directory) + 1
+    leader = f"{base_address + len(data):0>5}{record.leader[5:12]}{base_address:0>5}{record.leader[17:]}".encode("utf-8")
+    return leader + directory + pymarc.END_OF_FIELD.encode("utf-8") + data
+
+# ---------- MARCXML reader ----------
+
+def local_name(tag:str) -> str:
+    """Returns the tag without its namespace"""
+    return tag.rsplit("}", 1)[-1]
+
+def xml_to_record(xml_record:ET.Element) -> pymarc.Record:
+    """Returns the MARCXML record node as a pymarc record"""
+    record = pymarc.Record(to_unicode=True, force_utf8=True)
+    for node in xml_record:
+        tag = local_name(node.tag)
+        if tag == "leader":
+            record.leader = pymarc.Leader(node.text or "")
+        elif tag == "controlfield":
+            record.add_field(pymarc.Field(tag=node.get("tag"), data=node.text or ""))
+        elif tag == "datafield":
+            subfields = [Subfield(code=subf.get("code"), value=subf.text or "") for subf in node if local_name(subf.tag) == "subfield"]
+            record.add_field(pymarc.Field(tag=node.get("tag"), indicators=pymarc.Indicators(node.get("ind1", " "), node.get("ind2", " ")), subfields=subfields))
+    return record
+
+class MARCXML_Reader(object):
+    """MARCXML_Reader
+    =======
+    Streams pymarc records from a MARCXML file, like pymarc.MARCReader does for ISO2709.
+    Processed nodes are cleared so memory does not grow with the file size.
+    On init takes as argument the binary file handle"""
+    def __init__(self, file_handle:BinaryIO) -> None:
+        self.file_handle = file_handle
+
+    def __iter__(self):
+        root = None
+        for event, node in ET.iterparse(self.file_handle, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = node
+                continue
+            if local_name(node.tag) != "record":
+                continue
+            yield xml_to_record(node)
+            # Frees the processed record
+            node.clear()
+            if root is not node:
+                root.clear()
+
+    def close(self):
+        self.file_handle.close()
+
+class MARCWriter(pymarc.MARCWriter):
+    """MARCWriter
+    =======
+    pymarc.MARCWriter counting written records.
+    Records read by MARCReader with PATCH_TAGS set are patched instead of fully encoded again"""
+    nb_written = 0
+
+    def write(self, record:pymarc.Record) -> None:
+        marc = None
+        if isinstance(record, Patchable_Record):
+            marc = patch_marc(record)
+        if marc is None:
+            super().write(record)
+        else:
+            self.file_handle.write(marc)
+        self.nb_written += 1
+
+class MARCXML_Writer(pymarc.XMLWriter):
+    """MARCXML_Writer
+    =======
+    Streams records in a MARCXML collection, records are written as they come.
+    Like MARCReader with force_utf8, the leader is set to UTF-8"""
+    nb_written = 0
+
+    def write(self, record:pymarc.Record) -> None:
+        record.leader[9] = "a"
+        super().write(record)
+        self.nb_written += 1
+
+def is_stdio(path:str) -> bool:
+    """Returns if this path means stdin / stdout"""
+    return path == STDIO_PATH
+
+def open_input(path:str) -> BinaryIO:
+    """Returns the binary stream to read records from, decompressed if needed"""
+    if is_stdio(path):
+        return cio.open_stdin()
+    return cio.open_input(path)
+
+def open_output(path:str) -> BinaryIO:
+    """Returns the binary stream to write records in, compressed if the path extension is a compression one"""
+    if is_stdio(path):
+        return sys.stdout.buffer
+    return cio.open_output(path)
+
+def guess_input_format(file_handle:BinaryIO) -> Records_Formats:
+    """Returns the format of the stream based on its first non blank character, without consuming it.
+    The stream must support peek(), returning all the bytes asked for (see cio.make_peekable())"""
+    start = file_handle.peek(FORMAT_PEEK_SIZE)[:FORMAT_PEEK_SIZE].lstrip()
+    if start.startswith(b"<") or start.startswith(b"\xef\xbb\xbf<"):
+        return Records_Formats.MARCXML
+    return Records_Formats.ISO2709
+
+def guess_output_format(path:str, output_format:str=None, input_format:Records_Formats=None) -> Records_Formats:
+    """Returns the format to write records in :
+    the chosen format, else the one matching the path extension, else the input format, else ISO2709"""
+    if output_format:
+        return Records_Formats(output_format.lower())
+    extension = os.path.splitext(cio.strip_compression_extension(path))[1].lower()
+    if not is_stdio(path) and extension in FORMATS_EXTENSIONS:
+        return FORMATS_EXTENSIONS[extension]
+    if input_format:
+        return input_format
+    return Records_Formats.ISO2709
+
+def get_reader(path:str) -> pymarc.Reader|MARCXML_Reader:
+    """Returns a reader streaming records from this path (ISO2709 or MARCXML)"""
+    return get_stream_reader(open_input(path))
+
+def get_stream_reader(file_handle:BinaryIO) -> pymarc.Reader|MARCXML_Reader:
+    """Returns a reader streaming records from this binary stream (ISO2709 or MARCXML).
+    The stream must support peek()"""
+    file_handle = cio.make_peekable(file_handle, FORMAT_PEEK_SIZE)
+    if guess_input_format(file_handle) == Records_Formats.MARCXML:
+        return MARCXML_Reader(file_handle)
+    return MARCReader(file_handle, to_unicode=True, force_utf8=True)
+
+def get_reader_format(reader:pymarc.Reader|MARCXML_Reader) -> Records_Formats:
+    """Returns the format read by this reader"""
+    if isinstance(reader, MARCXML_Reader):
+        return Records_Formats.MARCXML
+    return Records_Formats.ISO2709
+
+def get_writer(path:str, output_format:Records_Formats=Records_Formats.ISO2709) -> pymarc.Writer:
+    """Returns a writer streaming records to this path"""
+    return get_stream_writer(open_output(path), output_format)
+
+def get_stream_writer(file_handle:BinaryIO, output_format:Records_Formats=Records_Formats.ISO2709) -> pymarc.Writer:
+    """Returns a writer streaming records to this binary stream"""
+    if output_format == Records_Formats.MARCXML:
+        return MARCXML_Writer(file_handle)
+    return MARCWriter(file_handle)
+
+def close_reader(reader:pymarc.Reader, path:str):
+    """Closes the reader, stdin is left open"""
+    if not is_stdio(path):
+        reader.close()
+
+def close_writer(writer:pymarc.Writer, path:str):
+    """Closes the writer, stdout is only flushed"""
+    if is_stdio(path):
+        writer.file_handle.flush()
+    writer.close(close_fh=not is_stdio(path))
+
+# ---------- Batch ----------
+
+def list_batch_inputs(path:str, output_dir:str) -> List[str]:
+    """Returns the files to process in batch, sorted : all files of the directory if path is one,
+    else all files matching path as a glob pattern.
+    Raises a ValueError if output_dir is the input directory"""
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in os.listdir(path) if not name.startswith(".")]
+    else:
+        files = glob.glob(path)
+    files = sorted([os.path.abspath(file) for file in files if os.path.isfile(file)])
+    for file in files:
+        if os.path.dirname(file) == os.path.abspath(output_dir):
+            raise ValueError(f"Output directory would overwrite input file {file}")
+    return files
+
+def get_batch_output_paths(path:str, output_dir:str) -> Tuple[str, str]:
+    """Returns the output file & errors file paths in output_dir for this input file.
+    The output file is compressed like the input file.
+    The errors file is named after the whole file name, so a.mrc & a.xml do not share the same one"""
+    name = os.path.basename(path)
+    return os.path.join(output_dir, name), os.path.join(output_dir, name + "_errors.csv")
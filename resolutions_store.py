@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+from enum import Enum
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Tuple
+
+# Keeps the IDs resolved with the SRU between runs in a SQLite file :
+#   - production runs load them as known elements & add the ones they resolve
+#   - the refresh job queries the stalest ones again, updates them & records what changed
+# Subfields are stored as a JSON list of [code, value]
+
+# See README.md for more informations
+
+# --------------- Enums ---------------
+
+class Change_Status(Enum):
+    CHANGED = "changed" # The target record subfields changed
+    REMOVED = "removed" # The SRU now returns multiple matches, the ID is resolved again by production runs
+    ERROR = "error" # The SRU failed, the resolution is left as it was
+
+# --------------- Class Objects ---------------
+
+class Resolution(object):
+    """Resolution
+    =======
+    An ID resolved with the SRU"""
+    __slots__ = ("step", "query", "id", "subfields", "resolved_at", "checked_at")
+
+    def __init__(self, step:str, query:str, id:str, subfields:List[Tuple[str, str]], resolved_at:float, checked_at:float) -> None:
+        self.step = step
+        self.query = query
+        self.id = id
+        self.subfields = subfields
+        self.resolved_at = resolved_at
+        self.checked_at = checked_at
+
+class Resolutions_Store(object):
+    """Resolutions_Store
+    =======
+    Resolutions by (step name, SRU query), with the time they were resolved & last checked.
+    On init take as arguments :
+        - path {str} : SQLite file (will be created if needed, its content is kept)
+    Can be shared between threads, and used by several processes at once"""
+    def __init__(self, path:str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=60)
+        # Readers & a writer can work at the same time
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS resolutions (
+            step TEXT, query TEXT, id TEXT, subfields TEXT, resolved_at REAL, checked_at REAL,
+            PRIMARY KEY (step, query))""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS resolutions_checked_at ON resolutions (checked_at)")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS changes (
+            step TEXT, query TEXT, id TEXT, status TEXT, old_subfields TEXT, new_subfields TEXT, message TEXT, checked_at REAL)""")
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM resolutions").fetchone()[0]
+
+    def save(self, step:str, query:str, id:str, subfields:List[Tuple[str, str]]):
+        """Adds or replaces the resolution of this query, resolved & checked now"""
+        now = time.time()
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO resolutions (step, query, id, subfields, resolved_at, checked_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (step, query, id, json.dumps([list(subf) for subf in subfields], ensure_ascii=False), now, now))
+
+    def load(self, checked_after:float=None) -> List[Resolution]:
+        """Returns all resolutions, only those checked after this timestamp if provided"""
+        with self.lock:
+            rows = self.db.execute("SELECT step, query, id, subfields, resolved_at, checked_at FROM resolutions WHERE checked_at > ?",
+                (checked_after if checked_after is not None else float("-inf"),)).fetchall()
+        return [self.__to_resolution(row) for row in rows]
+
+    def get_stalest(self, limit:int, checked_before:float=None, offset:int=0) -> List[Resolution]:
+        """Returns up to limit resolutions, least recently checked first, only those checked before this timestamp if provided.
+        The first offset ones are skipped"""
+        with self.lock:
+            rows = self.db.execute("SELECT step, query, id, subfields, resolved_at, checked_at FROM resolutions WHERE checked_at < ? "\
+                "ORDER BY checked_at, step, query LIMIT ? OFFSET ?",
+                (checked_before if checked_before is not None else float("inf"), limit, offset)).fetchall()
+        return [self.__to_resolution(row) for row in rows]
+
+    def refresh(self, resolution:Resolution, subfields:List[Tuple[str, str]]) -> bool:
+        """Marks the resolution as checked now with these subfields.
+        Returns True if they changed, the change being recorded"""
+        now = time.time()
+        subfields = [list(subf) for subf in subfields]
+        changed = subfields != [list(subf) for subf in resolution.subfields]
+        with self.lock:
+            self.db.execute("BEGIN")
+            if changed:
+                self.db.execute("UPDATE resolutions SET subfields = ?, resolved_at = ?, checked_at = ? WHERE step = ? AND query = ?",
+                    (json.dumps(subfields, ensure_ascii=False), now, now, resolution.step, resolution.query))
+                self.__record_change(resolution, Change_Status.CHANGED, subfields, "", now)
+            else:
+                self.db.execute("UPDATE resolutions SET checked_at = ? WHERE step = ? AND query = ?",
+                    (now, resolution.step, resolution.query))
+            self.db.execute("COMMIT")
+        return changed
+
+    def remove(self, resolution:Resolution, message:str):
+        """Deletes the resolution & records the change"""
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.execute("DELETE FROM resolutions WHERE step = ? AND query = ?", (resolution.step, resolution.query))
+            self.__record_change(resolution, Change_Status.REMOVED, None, message, time.time())
+            self.db.execute("COMMIT")
+
+    def record_error(self, resolution:Resolution, message:str):
+        """Records that the resolution could not be checked, leaving it as it was"""
+        with self.lock:
+            self.__record_change(resolution, Change_Status.ERROR, None, message, time.time())
+
+    def __record_change(self, resolution:Resolution, status:Change_Status, subfields:List[List[str]], message:str, now:float):
+        self.db.execute("INSERT INTO changes (step, query, id, status, old_subfields, new_subfields, message, checked_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (resolution.step, resolution.query, resolution.id, status.value, json.dumps([list(subf) for subf in resolution.subfields], ensure_ascii=False),
+            json.dumps(subfields, ensure_ascii=False) if subfields is not None else None, message, now))
+
+    def __to_resolution(self, row:tuple) -> Resolution:
+        step, query, id, subfields, resolved_at, checked_at = row
+        return Resolution(step, query, id, [tuple(subf) for subf in json.loads(subfields)], resolved_at, checked_at)
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+from concurrent.futures import Future
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+class Single_Flight(object):
+    """Single_Flight
+    =======
+    Coalesces concurrent calls with the same key : the first caller runs the function,
+    callers arriving while it runs wait for its result instead of running it again.
+    Nothing is cached once the call is over"""
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.calls:Dict[Hashable, Future] = {}
+        # Stats
+        self.shared = 0
+
+    def do(self, key:Hashable, func:Callable[[], Any]) -> Tuple[Any, bool]:
+        """Returns a tuple (result of func, True if it was shared with a call already running).
+        If func raises an exception, it is raised to all waiting callers"""
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.calls[key] = future
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = func()
+        except BaseException as generic_error:
+            future.set_exception(generic_error)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self.lock:
+                del self.calls[key]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+# Shared fixtures of the automated tests (run them with python -m pytest from the repository root)
+# The manual tests against a real Koha are listed in tests.md
+
+# external imports
+import os
+import subprocess
+import sys
+import pytest
+
+# Internal import
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT_DIR)
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+@pytest.fixture(scope="session")
+def workload(tmp_path_factory) -> str:
+    """Returns the directory of a small synthetic workload (records.mrc, export.xml, manual_checks.xml)"""
+    output_dir = str(tmp_path_factory.mktemp("workload"))
+    subprocess.run([sys.executable, os.path.join(ROOT_DIR, "benchmarks", "generate_workload.py"), output_dir,
+        "--records", "300", "--targets", "200", "--manual-share", "0.05", "--multiple-share", "0.05"],
+        check=True, capture_output=True)
+    return output_dir
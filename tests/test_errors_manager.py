@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+import csv
+
+# Internal import
+from errors_manager import Errors_Manager, Errors
+
+def read_rows(path) -> list:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f, delimiter=";"))
+
+def test_aggregation_keeps_messages_apart(tmp_path):
+    errors_path = tmp_path / "errors.csv"
+    err_man = Errors_Manager(str(errors_path), aggregate=True)
+    err_man.trigger_error(0, "", Errors.NO_RECORD_ID, "No 001 or 035", "")
+    err_man.trigger_error(1, "", Errors.NO_RECORD_ID, "No 001 or 035$a", "")
+    err_man.trigger_error(2, "3", Errors.SRU_ERROR, "Error occured during SRU request on ISSN", "1234-5678")
+    err_man.trigger_error(3, "4", Errors.SRU_ERROR, "Error occured during SRU request on ISBN", "1234-5678")
+    err_man.trigger_error(4, "5", Errors.SRU_ERROR, "Error occured during SRU request on ISBN", "1234-5678")
+    err_man.trigger_error(5, "6", Errors.SRU_ERROR, "Error occured during SRU request on ISBN", "978-2-00000-000-X")
+    err_man.close()
+
+    rows = [(row["error"], row["error_message"], row["data"], row["count"], row["indexes_sample"]) for row in read_rows(errors_path)]
+    assert rows == [
+        ("NO_RECORD_ID", "No 001 or 035", "", "1", "0"),
+        ("NO_RECORD_ID", "No 001 or 035$a", "", "1", "1"),
+        ("SRU_ERROR", "Error occured during SRU request on ISSN", "1234-5678", "1", "2"),
+        ("SRU_ERROR", "Error occured during SRU request on ISBN", "1234-5678", "2", "3,4"),
+        ("SRU_ERROR", "Error occured during SRU request on ISBN", "978-2-00000-000-X", "1", "5")
+    ]
+    summary = [(row["error"], row["error_message"], row["count"], row["distinct_data"]) for row in read_rows(tmp_path / "errors_summary.csv")]
+    assert summary == [
+        ("NO_RECORD_ID", "No 001 or 035", "1", "1"),
+        ("NO_RECORD_ID", "No 001 or 035$a", "1", "1"),
+        ("SRU_ERROR", "Error occured during SRU request on ISSN", "1", "1"),
+        ("SRU_ERROR", "Error occured during SRU request on ISBN", "3", "2")
+    ]
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import pytest
+import requests
+
+# Internal import
+from conftest import ROOT_DIR
+import api.Koha_SRU as ksru
+import api.Koha_SRU_Pool as ksrup
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_standin(workload:str, port:int) -> subprocess.Popen:
+    """Starts benchmarks/sru_standin.py on this port & waits until it answers"""
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, "benchmarks", "sru_standin.py"), os.path.join(workload, "export.xml"), str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/count", timeout=1)
+            return process
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"SRU stand-in did not start on port {port}")
+
+def get_count(port:int) -> int:
+    return int(requests.get(f"http://127.0.0.1:{port}/count", timeout=5).text)
+
+@pytest.fixture
+def standins(workload:str):
+    """Starts stand-ins with start(port), stops them after the test"""
+    processes = []
+    def start(port:int):
+        processes.append(start_standin(workload, port))
+    yield start
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+DIAGNOSTIC_RESPONSE = b'<?xml version="1.0" encoding="UTF-8"?>\n<zs:searchRetrieveResponse xmlns:zs="http://www.loc.gov/zing/srw/"><zs:version>1.1</zs:version>'\
+    b'<zs:numberOfRecords>0</zs:numberOfRecords><zs:diagnostics><diagnostic xmlns="http://www.loc.gov/zing/srw/diagnostic/">'\
+    b'<uri>info:srw/diagnostic/1/10</uri><message>Query syntax error</message></diagnostic></zs:diagnostics></zs:searchRetrieveResponse>'
+
+@pytest.fixture
+def http_servers():
+    """Starts servers answering every request with start(status, body), returns their URL & request counter"""
+    servers = []
+    def start(status:int, body:bytes=b""):
+        counter = {"requests":0}
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                return
+            def do_GET(self):
+                counter["requests"] += 1
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/", counter
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def search(pool:ksrup.Koha_SRU_Pool, biblionumber:int) -> ksru.SRU_Result_Search:
+    return pool.search(pool.generate_query([ksru.Part_Of_Query(ksru.SRU_Indexes.BIBLIONUMBER, ksru.SRU_Relations.EQUALS, biblionumber)]))
+
+def test_fails_over_dead_endpoint(standins):
+    dead_port, up_port = get_free_port(), get_free_port()
+    standins(up_port)
+    pool = ksrup.Koha_SRU_Pool([f"http://127.0.0.1:{dead_port}/", f"http://127.0.0.1:{up_port}/"], ksru.SRU_Version.V1_1,
+        routing=ksrup.Routing_Strategies.ROUND_ROBIN, max_failures=1, cooldown=60)
+    for biblionumber in range(1, 7):
+        res = search(pool, biblionumber)
+        assert res.get_status() == ksru.Status.SUCCESS.value
+        assert res.get_nb_results() == 1
+    dead, up = pool.stats()
+    # Out of rotation after its first failure
+    assert (dead["up"], dead["requests"], dead["errors"], dead["times_down"]) == (False, 1, 1, 1)
+    assert (up["up"], up["requests"], up["errors"]) == (True, 6, 0)
+    assert get_count(up_port) == 6
+
+def test_endpoint_back_in_rotation(standins):
+    back_port, up_port = get_free_port(), get_free_port()
+    standins(up_port)
+    pool = ksrup.Koha_SRU_Pool([f"http://127.0.0.1:{back_port}/", f"http://127.0.0.1:{up_port}/"], ksru.SRU_Version.V1_1,
+        routing=ksrup.Routing_Strategies.ROUND_ROBIN, max_failures=1, cooldown=0.5)
+    assert search(pool, 1).get_status() == ksru.Status.SUCCESS.value
+    assert pool.stats()[0]["up"] is False
+
+    standins(back_port)
+    time.sleep(0.6)
+    for biblionumber in range(2, 8):
+        assert search(pool, biblionumber).get_status() == ksru.Status.SUCCESS.value
+    back, up = pool.stats()
+    assert (back["up"], back["errors"], back["times_down"]) == (True, 1, 1)
+    assert pool.endpoints[0].consecutive_failures == 0
+    # Round robin shares the requests again
+    assert get_count(back_port) == 3
+    assert get_count(up_port) == 4
+
+def test_all_endpoints_down():
+    pool = ksrup.Koha_SRU_Pool([f"http://127.0.0.1:{get_free_port()}/", f"http://127.0.0.1:{get_free_port()}/"], ksru.SRU_Version.V1_1,
+        max_failures=1, cooldown=60)
+    res = search(pool, 1)
+    assert res.get_status() == ksru.Status.ERROR.value
+    assert [stats["errors"] for stats in pool.stats()] == [1, 1]
+    # Endpoints out of rotation are still tried when all are
+    search(pool, 2)
+    assert [stats["requests"] for stats in pool.stats()] == [2, 2]
+
+def test_single_probe_after_cooldown():
+    pool = ksrup.Koha_SRU_Pool(["http://127.0.0.1:9/", "http://127.0.0.1:10/"], ksru.SRU_Version.V1_1, max_failures=2, cooldown=60)
+    probed = pool.endpoints[0]
+    probed.consecutive_failures = 2
+    probed.down_until = time.monotonic() - 1
+    # The endpoint back from its cooldown gets a single request until it answers
+    assert pool.acquire_endpoint([]) is probed
+    assert pool.acquire_endpoint([]) is pool.endpoints[1]
+    assert pool.acquire_endpoint([]) is pool.endpoints[1]
+    pool.release_endpoint(probed, 0.01, True)
+    assert probed.accepts_requests(time.monotonic(), pool.max_failures)
+    assert probed.outstanding == 0
+
+def test_query_errors_keep_endpoints_healthy(http_servers):
+    bad_request_url, bad_request_counter = http_servers(400)
+    other_url, other_counter = http_servers(400)
+    pool = ksrup.Koha_SRU_Pool([bad_request_url, other_url], ksru.SRU_Version.V1_1,
+        routing=ksrup.Routing_Strategies.ROUND_ROBIN, max_failures=1, cooldown=60)
+    for biblionumber in range(1, 5):
+        res = search(pool, biblionumber)
+        assert res.get_status() == ksru.Status.ERROR.value
+        assert res.http_status == 400
+    # Not sent again to the other endpoint
+    assert (bad_request_counter["requests"], other_counter["requests"]) == (2, 2)
+    assert [(stats["up"], stats["errors"], stats["times_down"]) for stats in pool.stats()] == [(True, 0, 0), (True, 0, 0)]
+
+def test_diagnostics_keep_endpoints_healthy(http_servers):
+    urls = [http_servers(200, DIAGNOSTIC_RESPONSE)[0], http_servers(200, DIAGNOSTIC_RESPONSE)[0]]
+    pool = ksrup.Koha_SRU_Pool(urls, ksru.SRU_Version.V1_1, max_failures=1, cooldown=60)
+    for _ in range(4):
+        res = pool.search("dc.issn=")
+        assert res.get_status() == ksru.Status.SUCCESS.value
+        assert res.get_nb_results() == 0
+    assert [(stats["up"], stats["errors"]) for stats in pool.stats()] == [(True, 0), (True, 0)]
+
+def test_fails_over_server_error(http_servers):
+    unavailable_url, unavailable_counter = http_servers(503)
+    up_url, up_counter = http_servers(200, DIAGNOSTIC_RESPONSE)
+    pool = ksrup.Koha_SRU_Pool([unavailable_url, up_url], ksru.SRU_Version.V1_1, max_failures=1, cooldown=60)
+    for biblionumber in range(1, 4):
+        assert search(pool, biblionumber).get_status() == ksru.Status.SUCCESS.value
+    assert (unavailable_counter["requests"], up_counter["requests"]) == (1, 3)
+    unavailable, up = pool.stats()
+    assert (unavailable["up"], unavailable["errors"], unavailable["times_down"]) == (False, 1, 1)
+    assert up["up"] is True
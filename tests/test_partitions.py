@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+import os
+import subprocess
+import sys
+import pytest
+
+# Internal import
+from conftest import ROOT_DIR
+import partitions
+
+def run_script(workload:str, records_file:str, file_out:str, errors_file:str, manual_checks_file:str):
+    """Runs main.py on the local export of the workload (the SRU URL is never reached)"""
+    env = dict(os.environ, IGNORE_FIELDS="400,410", KEEP_V="1", KOHA_URL="http://127.0.0.1:9/",
+        LOCAL_EXPORT_FILE=os.path.join(workload, "export.xml"), RECORDS_FILE=records_file, FILE_OUT=file_out,
+        ERRORS_FILE=errors_file, MANUAL_CHECKS_FILE=manual_checks_file)
+    subprocess.run([sys.executable, os.path.join(ROOT_DIR, "main.py")], env=env, cwd=ROOT_DIR, check=True, capture_output=True)
+
+def read_bytes(path:str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+@pytest.mark.parametrize("nb_parts", [1, 3])
+def test_split_merge_same_as_single_run(workload:str, tmp_path, nb_parts:int):
+    records_file = os.path.join(workload, "records.mrc")
+    manual_checks_file = os.path.join(workload, "manual_checks.xml")
+    run_script(workload, records_file, str(tmp_path / "single.mrc"), str(tmp_path / "single.csv"), manual_checks_file)
+
+    parts_dir = tmp_path / "parts"
+    manifest = partitions.split(records_file, str(parts_dir), nb_parts, manual_checks_file)
+    assert len(manifest["partitions"]) == nb_parts
+    for partition in manifest["partitions"]:
+        run_script(workload, str(parts_dir / partition["records_file"]), str(parts_dir / partition["output_file"]),
+            str(parts_dir / partition["errors_file"]), str(parts_dir / manifest["manual_checks_file"]))
+    partitions.merge(str(parts_dir / partitions.MANIFEST_NAME), str(tmp_path / "merged.mrc"), str(tmp_path / "merged.csv"))
+
+    assert read_bytes(tmp_path / "merged.mrc") == read_bytes(tmp_path / "single.mrc")
+    assert read_bytes(tmp_path / "merged.csv") == read_bytes(tmp_path / "single.csv")
+
+def test_merge_detects_missing_record(workload:str, tmp_path):
+    records_file = os.path.join(workload, "records.mrc")
+    manifest = partitions.split(records_file, str(tmp_path), 2, os.path.join(workload, "manual_checks.xml"))
+    for partition in manifest["partitions"]:
+        run_script(workload, str(tmp_path / partition["records_file"]), str(tmp_path / partition["output_file"]),
+            str(tmp_path / partition["errors_file"]), str(tmp_path / manifest["manual_checks_file"]))
+    # Drops the last record of the first partition output
+    output_path = tmp_path / manifest["partitions"][0]["output_file"]
+    chunks = list(partitions.iter_chunks(str(output_path), partitions.rio.Records_Formats.ISO2709))
+    output_path.write_bytes(b"".join(chunks[:-1]))
+    with pytest.raises(ValueError):
+        partitions.merge(str(tmp_path / partitions.MANIFEST_NAME), str(tmp_path / "merged.mrc"), str(tmp_path / "merged.csv"))
+    assert not os.path.exists(tmp_path / "merged.mrc")
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+import io
+import os
+import pymarc
+import pytest
+
+# Internal import
+from conftest import TESTS_DIR
+import records_io as rio
+
+TAGS_4XX = [str(tag) for tag in range(400, 500)]
+
+@pytest.fixture(autouse=True)
+def patch_tags():
+    rio.set_patch_tags(TAGS_4XX)
+    yield
+    rio.set_patch_tags(None)
+
+def read_records(name:str) -> list:
+    with open(os.path.join(TESTS_DIR, name), "rb") as file_handle:
+        return list(rio.MARCReader(file_handle, to_unicode=True, force_utf8=True))
+
+def read_record_with_4xx() -> rio.Patchable_Record:
+    return [record for record in read_records("original_records.mrc") if record.get_fields(*TAGS_4XX)][-1]
+
+@pytest.mark.parametrize("name", ["original_records.mrc", "edited_records.mrc"])
+def test_unedited_records(name:str):
+    for record in read_records(name):
+        marc = rio.patch_marc(record)
+        assert marc is not None
+        assert marc == record.as_marc()
+
+def test_edited_4xx():
+    # The original records get the 4XX the script wrote in the edited ones
+    nb_changed = 0
+    for record, edited in zip(read_records("original_records.mrc"), read_records("edited_records.mrc")):
+        for field, edited_field in zip(record.fields, edited.fields):
+            assert field.tag == edited_field.tag
+            if field.tag in TAGS_4XX and field.subfields != edited_field.subfields:
+                field.subfields = list(edited_field.subfields)
+                nb_changed += 1
+        marc = rio.patch_marc(record)
+        assert marc is not None
+        assert marc == record.as_marc()
+    assert nb_changed > 0
+
+def test_single_edit_changes_lengths():
+    record = read_record_with_4xx()
+    field = record.get_fields(*TAGS_4XX)[0]
+    field.add_subfield("t", "A much longer title than before, to shift the following fields")
+    assert rio.patch_marc(record) == record.as_marc()
+    field.subfields = field.subfields[:1]
+    assert rio.patch_marc(record) == record.as_marc()
+
+def test_added_field_falls_back():
+    record = read_records("original_records.mrc")[0]
+    record.add_ordered_field(pymarc.Field(tag="410", indicators=[" ", "1"], subfields=[pymarc.Subfield("t", "Added")]))
+    assert rio.patch_marc(record) is None
+    output = io.BytesIO()
+    writer = rio.MARCWriter(output)
+    writer.write(record)
+    assert output.getvalue() == record.as_marc()
+
+def test_writer_output():
+    records = read_records("original_records.mrc")
+    edited = [record for record in records if record.get_fields(*TAGS_4XX)][-1]
+    edited.get_fields(*TAGS_4XX)[-1].subfields[0] = pymarc.Subfield("9", "12345")
+    output = io.BytesIO()
+    writer = rio.MARCWriter(output)
+    for record in records:
+        writer.write(record)
+    assert output.getvalue() == b"".join(record.as_marc() for record in records)
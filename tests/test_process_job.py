@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+import os
+import subprocess
+import sys
+
+# Internal import
+from conftest import ROOT_DIR, TESTS_DIR
+
+# main.py reads its settings when imported, so it runs in its own process
+SCRIPT = """
+import sys
+import main
+payload = open(sys.argv[1], "rb").read()
+try:
+    main.process_job(payload, "invalid")
+    raise AssertionError("Invalid format accepted")
+except ValueError:
+    pass
+assert getattr(main.JOB, "err_man", None) is None
+records, records_format, errors, nb_records = main.process_job(payload, "marcxml")
+assert records_format == main.rio.Records_Formats.MARCXML
+assert nb_records == 6
+assert getattr(main.JOB, "err_man", None) is None
+"""
+
+def test_invalid_format_clears_job(tmp_path):
+    env = dict(os.environ, IGNORE_FIELDS="400,410", KOHA_URL="http://127.0.0.1:9/", RECORDS_FILE=os.path.join(TESTS_DIR, "original_records.mrc"),
+        FILE_OUT=str(tmp_path / "out.mrc"), ERRORS_FILE=str(tmp_path / "errors.csv"))
+    process = subprocess.run([sys.executable, "-c", SCRIPT, os.path.join(TESTS_DIR, "original_records.mrc")],
+        env=env, cwd=ROOT_DIR, capture_output=True, text=True)
+    assert process.returncode == 0, process.stderr
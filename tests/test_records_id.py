@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+# Internal import
+import api.Koha_Local_Export as klex
+import api.Koha_SRU as ksru
+
+MARC_NS = "http://www.loc.gov/MARC21/slim"
+RECORDS = [
+    f'<record xmlns="{MARC_NS}"><leader>00000nas  2200000   4500</leader><controlfield tag="001">1</controlfield>'\
+        '<datafield tag="011" ind1=" " ind2=" "><subfield code="a">1234-5678</subfield></datafield></record>',
+    # No 001
+    f'<record xmlns="{MARC_NS}"><leader>00000nas  2200000   4500</leader>'\
+        '<datafield tag="011" ind1=" " ind2=" "><subfield code="a">1234-5678</subfield></datafield></record>',
+    f'<record xmlns="{MARC_NS}"><leader>00000nam  2200000   4500</leader>'\
+        '<datafield tag="010" ind1=" " ind2=" "><subfield code="a">978-2-00000-000-X</subfield></datafield></record>'
+]
+
+def test_local_export_record_without_001(tmp_path):
+    export_path = tmp_path / "export.xml"
+    export_path.write_text(f'<?xml version="1.0" encoding="UTF-8"?>\n<collection xmlns="{MARC_NS}">{"".join(RECORDS)}</collection>', encoding="utf-8")
+    export = klex.Koha_Local_Export(str(export_path), processes=1)
+    export.load()
+    res = export.search("dc.issn=1234-5678")
+    assert res.get_status() == klex.Status.SUCCESS.value
+    assert res.get_records_id() == ["1", None]
+    res = export.search("dc.isbn=978-2-00000-000-X")
+    assert res.get_records_id() == [None]
+
+def test_sru_record_without_001():
+    records = "".join([f'<zs:record><zs:recordSchema>marcxml</zs:recordSchema><zs:recordPacking>xml</zs:recordPacking>'\
+        f'<zs:recordData>{record}</zs:recordData></zs:record>' for record in RECORDS[:2]])
+    result = f'<?xml version="1.0" encoding="UTF-8"?>\n<zs:searchRetrieveResponse xmlns:zs="http://www.loc.gov/zing/srw/"><zs:version>1.1</zs:version>'\
+        f'<zs:numberOfRecords>2</zs:numberOfRecords><zs:records>{records}</zs:records></zs:searchRetrieveResponse>'
+    res = ksru.SRU_Result_Search(ksru.Status.SUCCESS, None, result, ksru.SRU_Record_Schemas.MARCXML.value, ksru.SRU_Version.V1_1.value,
+        10, 1, "dc.issn=1234-5678", "http://127.0.0.1:9/")
+    assert res.get_records_id() == ["1", None]
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+import os
+import subprocess
+import sys
+
+# Internal import
+from conftest import ROOT_DIR, TESTS_DIR
+
+def test_refresh_needs_resolutions_file(tmp_path):
+    env = dict(os.environ, IGNORE_FIELDS="400,410", KOHA_URL="http://127.0.0.1:9/", RECORDS_FILE=os.path.join(TESTS_DIR, "original_records.mrc"),
+        FILE_OUT=str(tmp_path / "out.mrc"), ERRORS_FILE=str(tmp_path / "errors.csv"), REFRESH_RESOLUTIONS="1", REFRESH_HOURS="0-24")
+    env.pop("RESOLUTIONS_FILE", None)
+    process = subprocess.run([sys.executable, os.path.join(ROOT_DIR, "main.py")], env=env, cwd=ROOT_DIR, capture_output=True, text=True, timeout=60)
+    assert process.returncode != 0
+    assert "REFRESH_RESOLUTIONS needs RESOLUTIONS_FILE to be set" in process.stderr
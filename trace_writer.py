@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+import json
+import queue
+import threading
+
+class Trace_Writer(object):
+    """Trace_Writer
+    =======
+    Writes trace entries as JSON lines in a background thread,
+    so the processing thread only pays for putting the entry in a queue.
+    On init take as arguments :
+        - file_path {str} : path to the trace file (will be created / rewrite existing one)
+        - [optional] buffer_size {int} : size of the file buffer in bytes
+        - [optional] max_pending {int} : maximum number of entries waiting to be written,
+        write() blocks once it is reached so memory does not grow if the disk is slow
+    Can be shared between threads"""
+    def __init__(self, file_path:str, buffer_size:int=1024*1024, max_pending:int=100000) -> None:
+        self.file_path = file_path
+        self.file = open(file_path, "w", buffering=buffer_size, encoding="utf-8")
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.nb_entries = 0
+        self.thread = threading.Thread(target=self.__run, name="Trace_Writer", daemon=True)
+        self.thread.start()
+
+    def write(self, entry:dict):
+        """Queues an entry, it must not be edited afterwards"""
+        self.queue.put(entry)
+
+    def __run(self):
+        """Writes queued entries until close() is called"""
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                break
+            self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.nb_entries += 1
+
+    def close(self):
+        """Writes all queued entries and closes the file"""
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()